@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""Benchmark the query and render paths of the app against the number of work chains.
+
+The work chains are created in a temporary synthetic profile, see `synthetic`.
+Timed entry points (best of `--repeat`, cold caches):
+
+* `find_work_chains`: `WorkChainSelectorWidget.find_work_chains`.
+* `index_work_chains`: full (re)indexing of the search extras.
+* `search`, `search_formula`: first page of `SearchCompletedWidget.search`,
+  without and with a formula filter.
+* `export_results`: CSV export of all the finished work chains.
+* `render_thumbnail`: thumbnail of a molecule.
+* `work_chain_viewer`: `WorkChainViewer` with its rendered summary, orbital
+  images and SPM maps.
+
+The timings can be saved with `--save` and compared with `--baseline`: the
+benchmark fails if any of them is slower than the baseline by more than
+`--threshold`. Usage:
+
+    python benchmarks/app_paths.py --sizes 100 1000 10000 --save baseline.json
+    python benchmarks/app_paths.py --baseline baseline.json --threshold 0.25
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import ase.build
+import matplotlib
+from aiida import orm
+from synthetic import (
+    create_profile,
+    create_shared_inputs,
+    create_shared_outputs,
+    populate,
+)
+
+from empa_molecules.utils import get_thumbnail_executor
+
+# Timings shorter than this (s) are not compared with the baseline, they are
+# dominated by noise.
+MIN_COMPARED_TIME = 0.005
+
+# Time (s) to wait for the outputs rendered in the background.
+RENDER_TIMEOUT = 60
+
+
+def _wait_for(condition):
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > RENDER_TIMEOUT:
+            raise TimeoutError("The outputs were not rendered in time.")
+        time.sleep(0.005)
+
+
+def _best_time(func, repeat):
+    func()  # warm-up, e.g. for the deferred imports
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def time_entry_points(repeat):
+    from aiida_nanotech_empa.workflows.gaussian import GaussianSpinWorkChain
+
+    from empa_molecules import cube_planes
+    from empa_molecules.export import export_work_chains
+    from empa_molecules.search_index import index_work_chains
+    from empa_molecules.utils import render_thumbnail
+    from empa_molecules.widgets import (
+        SearchCompletedWidget,
+        WorkChainSelectorWidget,
+        WorkChainViewer,
+    )
+
+    def find_work_chains():
+        list(WorkChainSelectorWidget.find_work_chains())
+
+    def index():
+        index_work_chains(incremental=False)
+
+    def search(formula=""):
+        SearchCompletedWidget._results_cache.clear()
+        widget = SearchCompletedWidget(workchain_class=GaussianSpinWorkChain)
+        widget.inp_formula.value = formula
+        widget.search()
+
+    def export():
+        with tempfile.TemporaryDirectory() as directory:
+            export_work_chains(
+                os.path.join(directory, "results.csv"),
+                filters={"attributes.exit_status": 0},
+            )
+
+    def thumbnail():
+        render_thumbnail(ase.build.molecule("C6H6"))
+
+    node = (
+        orm.QueryBuilder()
+        .append(orm.WorkChainNode)
+        .order_by({orm.WorkChainNode: {"id": "desc"}})
+        .first(flat=True)
+    )
+
+    def work_chain_viewer():
+        WorkChainViewer._rendered_outputs.clear()
+        cube_planes._cache.clear()
+        cube_planes._maps_cache.clear()
+
+        # Outside of a notebook, the displayed widgets are printed. The summary
+        # is rendered in a thread that captures stdout in turn, it has to be
+        # done before stdout is restored.
+        with contextlib.redirect_stdout(io.StringIO()):
+            viewer = WorkChainViewer(node)
+            _wait_for(
+                lambda: viewer._out_summary.outputs != WorkChainViewer.LOADING_OUTPUTS
+            )
+            viewer._tabs.selected_index = 1
+            viewer.cube_files.value = "gs_cube_images"
+            viewer._tabs.selected_index = 2
+            viewer._cube_files_for_spm.value = "gs_cube_planes"
+            viewer._plot_spm()
+
+        for output in viewer._out_summary.outputs:
+            if output.get("name") == "stderr":
+                raise RuntimeError(f"The summary failed:\n{output['text']}")
+        if viewer._spm_maps is None:
+            raise RuntimeError("The SPM maps were not computed.")
+
+    return {
+        "find_work_chains": _best_time(find_work_chains, repeat),
+        "index_work_chains": _best_time(index, repeat),
+        "search": _best_time(search, repeat),
+        "search_formula": _best_time(lambda: search("C6H6"), repeat),
+        "export_results": _best_time(export, repeat),
+        "render_thumbnail": _best_time(thumbnail, repeat),
+        "work_chain_viewer": _best_time(work_chain_viewer, repeat),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the timings and return the regressions with respect to the baseline."""
+    regressions = []
+    print(f"{'work chains':>12} {'entry point':>18} {'time (s)':>10} {'baseline':>10}")
+    for size, timings in results.items():
+        for name, timing in timings.items():
+            reference = baseline.get(size, {}).get(name)
+            line = f"{size:>12} {name:>18} {timing:>10.3f}"
+            if reference is not None:
+                line += f" {reference:>10.3f} {100 * (timing / reference - 1):+6.0f}%"
+                if (
+                    timing > (1 + threshold) * reference
+                    and timing - reference > MIN_COMPARED_TIME
+                ):
+                    regressions.append((size, name))
+                    line += "  REGRESSION"
+            print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="Save the timings to this JSON file.")
+    parser.add_argument("--baseline", help="Compare with the timings of this file.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Maximum relative slow-down with respect to the baseline.",
+    )
+    args = parser.parse_args()
+
+    matplotlib.use("Agg")
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Keep the thumbnails and cube planes of the user out of the benchmark.
+        os.environ["XDG_CACHE_HOME"] = os.path.join(directory, "cache")
+        create_profile(os.path.join(directory, "storage"))
+        shared_inputs = create_shared_inputs()
+        shared_outputs = create_shared_outputs()
+
+        results = {}
+        n_created = 0
+        for size in sorted(args.sizes):
+            populate(size - n_created, shared_inputs, shared_outputs, start=n_created)
+            n_created = size
+            results[str(size)] = time_entry_points(args.repeat)
+
+        # Let the background renderings (e.g. thumbnails) finish before the
+        # cache directory is removed.
+        get_thumbnail_executor().shutdown(wait=True)
+        for thread in threading.enumerate():
+            if thread is not threading.current_thread():
+                thread.join(RENDER_TIMEOUT)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save:
+        with open(args.save, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {100 * args.threshold:.0f}%.")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
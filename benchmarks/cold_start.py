@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""Benchmark the cold start of the spin calculation app.
+
+Every sample runs in a fresh interpreter, which imports the app modules and
+constructs the widgets of `spin_calculation.ipynb` with the given AiiDA profile
+(the default profile if omitted). The benchmark fails if a heavy module that
+should only be imported on first use is imported at start-up, or if the median
+import time exceeds `--max-import-time`. Usage:
+
+    python benchmarks/cold_start.py --repeat 5 --max-import-time 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Modules that are only needed once a finished work chain is viewed.
+DEFERRED_MODULES = [
+    "aiida_nanotech_empa.utils.gaussian_wcs_postprocess",
+    "aiida_nanotech_empa.utils.stm_tools",
+]
+
+SAMPLE = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+from aiida import load_profile
+
+from empa_molecules import steps, widgets
+
+import_time = time.perf_counter() - start
+
+load_profile(%r)
+
+start = time.perf_counter()
+work_chain_selector = widgets.WorkChainSelectorWidget(auto_refresh_interval=0)
+app = [
+    steps.StructureSelectionStep(auto_advance=True),
+    steps.ConfigureGaussianCalculationStep(auto_advance=True),
+    steps.SubmitGaussianCalculationStep(auto_advance=True),
+    steps.ViewGaussianWorkChainStatusAndResultsStep(auto_advance=True),
+]
+construction_time = time.perf_counter() - start
+
+print(
+    json.dumps(
+        {
+            "import": import_time,
+            "construction": construction_time,
+            "deferred_imported": [m for m in %r if m in sys.modules],
+        }
+    )
+)
+"""
+
+
+def run_sample(profile):
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", SAMPLE % (profile, DEFERRED_MODULES)],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--max-import-time",
+        type=float,
+        default=None,
+        help="Fail if the median import time (s) exceeds this value.",
+    )
+    args = parser.parse_args()
+
+    samples = [run_sample(args.profile) for _ in range(args.repeat)]
+
+    print(f"{'stage':>14} {'median (s)':>11} {'min (s)':>9}")
+    for stage in ("import", "construction"):
+        timings = [sample[stage] for sample in samples]
+        print(f"{stage:>14} {statistics.median(timings):>11.3f} {min(timings):>9.3f}")
+
+    failed = False
+    deferred_imported = sorted(
+        {module for sample in samples for module in sample["deferred_imported"]}
+    )
+    if deferred_imported:
+        print(f"Imported at start-up: {', '.join(deferred_imported)}")
+        failed = True
+    import_time = statistics.median(sample["import"] for sample in samples)
+    if args.max_import_time is not None and import_time > args.max_import_time:
+        print(f"Import time exceeds {args.max_import_time} s.")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
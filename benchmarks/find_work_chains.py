@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""Benchmark `WorkChainSelectorWidget.find_work_chains` against the number of work chains.
+
+The work chains are created in a temporary synthetic profile, see `synthetic`,
+so that neither a database server nor RabbitMQ is needed. Usage:
+
+    python benchmarks/find_work_chains.py --sizes 100 1000 5000
+"""
+import argparse
+import tempfile
+import time
+
+from synthetic import create_profile, populate
+
+
+def time_find_work_chains(repeat):
+    from empa_molecules.widgets import WorkChainSelectorWidget
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n_found = len(list(WorkChainSelectorWidget.find_work_chains()))
+        timings.append(time.perf_counter() - start)
+    return n_found, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        create_profile(directory)
+
+        n_created = 0
+        print(f"{'work chains':>12} {'time (s)':>10} {'per row (ms)':>13}")
+        for size in sorted(args.sizes):
+            populate(size - n_created, start=n_created)
+            n_created = size
+            n_found, timing = time_find_work_chains(args.repeat)
+            print(f"{n_found:>12} {timing:>10.3f} {1000 * timing / n_found:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
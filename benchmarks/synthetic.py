@@ -0,0 +1,194 @@
+"""Synthetic AiiDA profiles for the benchmarks.
+
+The profiles use the SQLite storage (no database server, no RabbitMQ, no
+computer) and are filled with nodes that have the shape of the
+GaussianSpinWorkChains: input structure and parameters, ground-state structure
+and energy, cube images and planes. The heavy outputs are shared by all the work
+chains, so that large profiles are quick to create.
+"""
+
+import io
+
+import ase.build
+import numpy as np
+from aiida import load_profile, orm
+from aiida.common import timezone
+from aiida.common.links import LinkType
+from aiida.common.utils import get_new_uuid
+from aiida.manage import get_manager
+from aiida.manage.configuration.profile import Profile
+from aiida.orm.entities import EntityTypes
+from aiida.storage.sqlite_dos import SqliteDosStorage
+from PIL import Image
+
+MOLECULES = ["C6H6", "CH4", "H2O", "C2H6", "NH3", "CH3CH2OH", "C4H4O", "CH3CN"]
+
+
+def create_profile(directory):
+    """Create and load a SQLite profile whose storage is in `directory`."""
+    profile = Profile(
+        "benchmark",
+        {
+            "default_user_email": "benchmark@localhost",
+            "storage": {
+                "backend": "core.sqlite_dos",
+                "config": {"filepath": str(directory)},
+            },
+            "process_control": {"backend": None, "config": {}},
+            "options": {},
+        },
+    )
+    SqliteDosStorage.initialise(profile)
+    load_profile(profile, allow_switch=True)
+    orm.User(email=profile.default_user_email).store()
+
+
+def _make_image(seed, size=400):
+    rng = np.random.default_rng(seed)
+    image = Image.fromarray(rng.integers(0, 255, (size, size, 3), dtype=np.uint8))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def create_shared_outputs(n_orbitals=8):
+    """Create the cube outputs, linked to all the work chains."""
+    homo = n_orbitals // 2
+    moenergies = list(np.linspace(-9.0, 1.0, n_orbitals + 2))
+    out_params = orm.Dict(
+        {
+            "homos": [homo, homo],
+            "moenergies": [moenergies, moenergies],
+            "mult": 1,
+            "spin_expectation_values": [{"S**2": 0.0, "S": 0.0}],
+        }
+    ).store()
+
+    images = orm.FolderData()
+    for name in ["spin_iv0.010_z+.png", "spin_iv0.010_x+.png"] + [
+        f"{i_orb}_{spin}_{label}_iv0.020_{view}.png"
+        for i_orb in range(homo - 1, homo + 3)
+        for spin, label in [("a", "HOMO"), ("b", "LUMO")]
+        for view in ["z+", "x+"]
+    ]:
+        images.base.repository.put_object_from_bytes(_make_image(len(name)), name)
+    images.store()
+
+    rng = np.random.default_rng(0)
+    planes = orm.ArrayData()
+    planes.set_array("x_arr", np.linspace(0, 20, 128))
+    planes.set_array("y_arr", np.linspace(0, 16, 96))
+    planes.set_array("h_arr", np.array([2.0, 3.0]))
+    for i_orb in range(1, n_orbitals + 1):
+        for spin in ["a", "b"]:
+            planes.set_array(f"cube_{i_orb}_{spin}", rng.normal(size=(128, 96, 2)))
+    planes.store()
+
+    return {
+        "gs_out_params": out_params,
+        "gs_cube_images": images,
+        "gs_cube_planes": planes,
+        "gs_ionization_potential": orm.Float(7.0).store(),
+        "gs_electron_affinity": orm.Float(1.0).store(),
+        "gs_multiplicity": orm.Int(1).store(),
+    }
+
+
+def create_shared_inputs():
+    """Create the parameter inputs, shared by all the work chains."""
+    return {
+        "functional": orm.Str("B3LYP").store(),
+        "empirical_dispersion": orm.Str("GD3").store(),
+        "basis_set_opt": orm.Str("6-311G(d,p)").store(),
+        "basis_set_scf": orm.Str("6-311G(d,p)").store(),
+        "multiplicity_list": orm.List([1]).store(),
+    }
+
+
+def populate(n_work_chains, shared_inputs=None, shared_outputs=None, start=0):
+    """Create `n_work_chains` finished GaussianSpinWorkChain-like graphs.
+
+    Each work chain has a structure input, a ground-state structure and energy,
+    and the shared inputs and outputs. The nodes and links are inserted in bulk,
+    storing them one by one would take hours for the largest profiles.
+    """
+    from aiida_nanotech_empa.workflows.gaussian import GaussianSpinWorkChain
+
+    structures = [
+        orm.StructureData(ase=ase.build.molecule(name)).store() for name in MOLECULES
+    ]
+    user_id = orm.User.collection.get_default().pk
+    now = timezone.now()
+
+    def node_row(node_type, attributes, **kwargs):
+        row = {
+            "uuid": get_new_uuid(),
+            "node_type": node_type,
+            "process_type": None,
+            "label": "",
+            "description": "",
+            "ctime": now,
+            "mtime": now,
+            "attributes": attributes,
+            "extras": {},
+            "repository_metadata": {},
+            "dbcomputer_id": None,
+            "user_id": user_id,
+        }
+        row.update(kwargs)
+        return row
+
+    storage = get_manager().get_profile_storage()
+    with storage.transaction():
+        indices = range(start, start + n_work_chains)
+        work_chain_pks = storage.bulk_insert(
+            EntityTypes.NODE,
+            [
+                node_row(
+                    "process.workflow.workchain.WorkChainNode.",
+                    {
+                        "process_label": "GaussianSpinWorkChain",
+                        "process_state": "finished",
+                        "exit_status": 0,
+                        "sealed": True,
+                    },
+                    process_type=GaussianSpinWorkChain.build_process_type(),
+                    description=f"benchmark {i}",
+                )
+                for i in indices
+            ],
+        )
+        energy_pks = storage.bulk_insert(
+            EntityTypes.NODE,
+            [
+                node_row("data.core.float.Float.", {"value": -100.0 - 0.01 * i})
+                for i in indices
+            ],
+        )
+
+        links = []
+        for i, work_chain_pk, energy_pk in zip(indices, work_chain_pks, energy_pks):
+            structure_pk = structures[i % len(structures)].pk
+            inputs = {label: node.pk for label, node in (shared_inputs or {}).items()}
+            inputs["structure"] = structure_pk
+            outputs = {label: node.pk for label, node in (shared_outputs or {}).items()}
+            outputs.update({"gs_structure": structure_pk, "gs_energy": energy_pk})
+            links += [
+                {
+                    "input_id": pk,
+                    "output_id": work_chain_pk,
+                    "label": label,
+                    "type": LinkType.INPUT_WORK.value,
+                }
+                for label, pk in inputs.items()
+            ]
+            links += [
+                {
+                    "input_id": work_chain_pk,
+                    "output_id": pk,
+                    "label": label,
+                    "type": LinkType.RETURN.value,
+                }
+                for label, pk in outputs.items()
+            ]
+        storage.bulk_insert(EntityTypes.LINK, links)
@@ -0,0 +1,164 @@
+"""Submission of a campaign of GaussianSpinWorkChains, one per structure.
+
+The work chains are submitted from a task of the event loop (the one of the
+Jupyter kernel), keeping the number of active work chains whose Gaussian code
+runs on the same computer below a limit. All the work chains of a campaign are
+added to one group. The submission is not done in a thread, because the AiiDA
+nodes can not be shared between threads, but the task yields to the event loop
+after each submission and the structures given as SMILES are generated in an
+executor, so that the kernel stays responsive.
+"""
+
+import asyncio
+import os
+import tempfile
+
+import ase
+import ase.io
+import numpy as np
+import traitlets
+from aiida import engine, orm
+
+from .search_index import set_formula
+
+ACTIVE_PROCESS_STATES = ["created", "waiting", "running"]
+
+
+def read_structures(content, filename):
+    """Return all the frames of a structure file (e.g. a multi-frame XYZ)."""
+    # ase guesses the format from the file name.
+    suffix = os.path.splitext(filename)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        tmp.write(content)
+        tmp.flush()
+        return ase.io.read(tmp.name, index=":")
+
+
+def smiles_to_atoms(smiles):
+    """Return a 3D structure of the molecule `smiles`, optimized with the UFF force field.
+
+    Requires the rdkit library.
+    """
+    from rdkit import Chem
+    from rdkit.Chem import AllChem
+
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        raise ValueError(f"Invalid SMILES string: {smiles!r}")
+    mol = Chem.AddHs(mol)
+    if AllChem.EmbedMolecule(mol, maxAttempts=20, randomSeed=42) < 0:
+        raise ValueError(f"Could not generate a conformer for {smiles!r}")
+    if AllChem.UFFHasAllMoleculeParams(mol):
+        AllChem.UFFOptimizeMolecule(mol, maxIters=1000)
+
+    atoms = ase.Atoms(
+        [atom.GetSymbol() for atom in mol.GetAtoms()],
+        positions=mol.GetConformer().GetPositions(),
+    )
+    atoms.cell = np.ptp(atoms.positions, axis=0) + 10
+    atoms.center()
+    atoms.info["smiles"] = smiles
+    return atoms
+
+
+def count_active_work_chains(computer):
+    """Count the active GaussianSpinWorkChains whose Gaussian code runs on `computer`."""
+    qb = orm.QueryBuilder()
+    qb.append(
+        orm.WorkChainNode,
+        filters={
+            "attributes.process_label": "GaussianSpinWorkChain",
+            "attributes.process_state": {"in": ACTIVE_PROCESS_STATES},
+        },
+        tag="work_chain",
+    )
+    qb.append(
+        orm.AbstractCode,
+        with_outgoing="work_chain",
+        edge_filters={"label": "gaussian_code"},
+        tag="code",
+    )
+    qb.append(orm.Computer, with_node="code", filters={"id": computer.pk})
+    return qb.count()
+
+
+class Campaign(traitlets.HasTraits):
+    """Submit one work chain per structure, at most `max_active` at a time.
+
+    The structures (ase.Atoms or SMILES strings) are only converted into
+    builders, with `get_builder(structure)`, when they are about to be submitted.
+    """
+
+    n_submitted = traitlets.Int(0)
+    n_failed = traitlets.Int(0)
+    running = traitlets.Bool(False)
+
+    def __init__(
+        self,
+        structures,
+        get_builder,
+        group_label,
+        computer,
+        max_active=10,
+        poll_interval=30,
+        **kwargs,
+    ):
+        self.structures = iter(structures)
+        self.get_builder = get_builder
+        self.group, _ = orm.Group.collection.get_or_create(label=group_label)
+        self.computer = computer
+        self.max_active = max_active
+        self.poll_interval = poll_interval
+        self.errors = []
+        self._task = None
+        super().__init__(**kwargs)
+
+    def start(self):
+        """Run the campaign in the background, in the current event loop."""
+        self.running = True
+        self._task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def run(self):
+        self.running = True
+        try:
+            exhausted = False
+            while not exhausted:
+                n_free = self.max_active - count_active_work_chains(self.computer)
+                while n_free > 0:
+                    try:
+                        structure = next(self.structures)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if await self._submit(structure):
+                        n_free -= 1
+                    # Let the kernel handle the other events (e.g. the widgets)
+                    # between two submissions.
+                    await asyncio.sleep(0)
+                if not exhausted:
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            self.running = False
+
+    async def _submit(self, structure):
+        try:
+            if isinstance(structure, str):
+                # The conformer generation is slow, but does not use AiiDA.
+                structure = await asyncio.get_running_loop().run_in_executor(
+                    None, smiles_to_atoms, structure
+                )
+            structure = orm.StructureData(ase=structure)
+            builder = self.get_builder(structure)
+            process = engine.submit(builder)
+        except Exception as error:
+            self.errors.append(error)
+            self.n_failed += 1
+            return False
+        self.group.add_nodes(process)
+        set_formula(process, structure)
+        self.n_submitted += 1
+        return True
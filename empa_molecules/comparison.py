@@ -0,0 +1,180 @@
+"""Comparison of the energies of many GaussianSpinWorkChains.
+
+The energies of all the work chains (per multiplicity, optimized and vertical,
+and the ionization potential and electron affinity) are fetched with a single
+query into arrays with one row per work chain. The ground states, the energies
+relative to them and the spin gaps are then computed on the whole arrays at
+once, so that hundreds of work chains can be compared interactively.
+"""
+
+import numpy as np
+from aiida import orm
+
+# Float outputs of the GaussianSpinWorkChain that are not per multiplicity.
+SCALAR_OUTPUTS = {
+    "gs_ionization_potential": "ionization_potential",
+    "gs_electron_affinity": "electron_affinity",
+}
+
+
+def get_comparison_rows(filters=None, group_label=None):
+    """Return the energies of the matching work chains, one row per energy.
+
+    The work chains can be restricted with `filters` (on the work chain) and to
+    the members of the group `group_label`. Each row is (pk, uuid, formula,
+    functional, basis set, energy, output label).
+    """
+    qb = orm.QueryBuilder()
+    relationship = {}
+    if group_label is not None:
+        qb.append(orm.Group, filters={"label": group_label}, tag="group")
+        relationship["with_group"] = "group"
+    qb.append(
+        orm.WorkChainNode,
+        filters={
+            "attributes.process_label": "GaussianSpinWorkChain",
+            **(filters or {}),
+        },
+        project=["id", "uuid", "extras.formula"],
+        tag="wc",
+        **relationship,
+    )
+    for label in ["functional", "basis_set_opt"]:
+        qb.append(
+            orm.Str,
+            with_outgoing="wc",
+            edge_filters={"label": label},
+            project="attributes.value",
+        )
+    qb.append(
+        orm.Float,
+        with_incoming="wc",
+        edge_filters={
+            "or": [
+                {"label": {"like": "m%_opt_energy"}},
+                {"label": {"like": "m%_vert_energy"}},
+                {"label": {"in": list(SCALAR_OUTPUTS)}},
+            ]
+        },
+        edge_project="label",
+        project="attributes.value",
+    )
+    return qb.all()
+
+
+class Comparison:
+    """Energies (eV) of a set of work chains, as arrays with one row per work chain.
+
+    The arrays per multiplicity have one column per multiplicity of
+    `multiplicities`. Missing energies are NaN.
+    """
+
+    COLUMNS = {
+        "pk": "PK",
+        "formula": "Formula",
+        "functional": "Functional",
+        "basis_set": "Basis set",
+        "gs_multiplicity": "GS mult.",
+        "gs_energy": "GS energy (eV)",
+        "spin_gap": "Spin gap (eV)",
+        "ionization_potential": "IP (eV)",
+        "electron_affinity": "EA (eV)",
+    }
+
+    def __init__(self, rows):
+        pks, uuids, formulas, functionals, basis_sets, values, labels = (
+            list(zip(*rows)) if rows else [()] * 7
+        )
+        self.pks, first, work_chain = np.unique(
+            np.array(pks, dtype=int), return_index=True, return_inverse=True
+        )
+        self.uuids = np.array(uuids, dtype=object)[first]
+        self.formulas = np.array([formula or "" for formula in formulas])[first]
+        self.functionals = np.array(functionals, dtype=str)[first]
+        self.basis_sets = np.array(basis_sets, dtype=str)[first]
+        labels = np.array(labels, dtype=str)
+        values = np.array(values, dtype=float)
+
+        # The labels are "m{multiplicity}_opt_energy" or "m{multiplicity}_vert_energy".
+        is_opt = np.char.endswith(labels, "_opt_energy")
+        is_vert = np.char.endswith(labels, "_vert_energy")
+        per_multiplicity = is_opt | is_vert
+        multiplicity = np.full(len(labels), -1)
+        multiplicity[per_multiplicity] = [
+            int(label[1 : label.index("_")]) for label in labels[per_multiplicity]
+        ]
+        self.multiplicities = np.unique(multiplicity[per_multiplicity])
+        column = np.searchsorted(self.multiplicities, multiplicity)
+
+        n_work_chains = len(self.pks)
+        shape = (n_work_chains, len(self.multiplicities))
+        self.opt_energies = np.full(shape, np.nan)
+        self.opt_energies[work_chain[is_opt], column[is_opt]] = values[is_opt]
+        self.vert_energies = np.full(shape, np.nan)
+        self.vert_energies[work_chain[is_vert], column[is_vert]] = values[is_vert]
+        for label, name in SCALAR_OUTPUTS.items():
+            selected = labels == label
+            setattr(self, name, np.full(n_work_chains, np.nan))
+            getattr(self, name)[work_chain[selected]] = values[selected]
+
+        # The ground state is the multiplicity with the lowest optimized energy.
+        energies = np.where(np.isnan(self.opt_energies), np.inf, self.opt_energies)
+        has_gs = np.isfinite(energies).any(axis=1)
+        gs_column = np.zeros(n_work_chains, dtype=int)
+        if shape[1]:
+            gs_column = energies.argmin(axis=1)
+        self.gs_energy = np.full(n_work_chains, np.nan)
+        self.gs_energy[has_gs] = energies[has_gs, gs_column[has_gs]]
+        self.gs_multiplicity = np.full(n_work_chains, np.nan)
+        self.gs_multiplicity[has_gs] = self.multiplicities[gs_column[has_gs]]
+
+        self.relative_opt_energies = self.opt_energies - self.gs_energy[:, None]
+        self.relative_vert_energies = self.vert_energies - self.gs_energy[:, None]
+
+        # Lowest optimized energy of another multiplicity than the ground state.
+        energies[has_gs, gs_column[has_gs]] = np.inf
+        self.spin_gap = energies.min(axis=1, initial=np.inf) - self.gs_energy
+        self.spin_gap[~np.isfinite(self.spin_gap)] = np.nan
+
+    @classmethod
+    def from_database(cls, filters=None, group_label=None):
+        return cls(get_comparison_rows(filters, group_label))
+
+    def __len__(self):
+        return len(self.pks)
+
+    def get_columns(self):
+        """Return the columns, by name: the summary ones, then the relative energies."""
+        columns = {
+            "pk": self.pks,
+            "formula": self.formulas,
+            "functional": self.functionals,
+            "basis_set": self.basis_sets,
+            "gs_multiplicity": self.gs_multiplicity,
+            "gs_energy": self.gs_energy,
+            "spin_gap": self.spin_gap,
+            "ionization_potential": self.ionization_potential,
+            "electron_affinity": self.electron_affinity,
+        }
+        for i, multiplicity in enumerate(self.multiplicities):
+            columns[f"m{multiplicity}_opt"] = self.relative_opt_energies[:, i]
+            columns[f"m{multiplicity}_vert"] = self.relative_vert_energies[:, i]
+        return columns
+
+    def get_column_names(self):
+        names = dict(self.COLUMNS)
+        for multiplicity in self.multiplicities:
+            names[f"m{multiplicity}_opt"] = f"ΔE opt. m{multiplicity} (eV)"
+            names[f"m{multiplicity}_vert"] = f"ΔE vert. m{multiplicity} (eV)"
+        return names
+
+    def get_order(self, column, descending=False):
+        """Return the indices of the work chains sorted by `column`, NaNs last."""
+        values = self.get_columns()[column]
+        if values.dtype.kind in "fi":
+            order = np.argsort(-values if descending else values, kind="stable")
+        else:
+            order = np.argsort(values.astype(str), kind="stable")
+            if descending:
+                order = order[::-1]
+        return order
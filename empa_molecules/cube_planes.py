@@ -0,0 +1,248 @@
+"""Process-wide cache of the cube planes used by the SPM simulations.
+
+The planes of the `m*_opt_cube_planes` outputs can take hundreds of MB. Instead
+of being loaded into memory, they are memory-mapped from the file repository,
+and the processed planes are kept in an LRU cache with a memory budget, keyed
+on the node UUID. The SPM maps computed from them (`SpmMaps`) are cached too.
+"""
+
+import io
+import os
+import tempfile
+
+import numpy as np
+from aiida_nanotech_empa.helpers import ANG_TO_BOHR, HART_2_EV
+
+from .utils import LRUCache, get_cache_dir, import_stm_tools
+
+# Memory budgets (bytes) of the cached planes and of the cached SPM maps.
+CACHE_SIZE = 1024**3
+MAPS_CACHE_SIZE = 512 * 1024**2
+
+
+def load_array(node, name):
+    """Return the array `name` of the ArrayData `node`, memory-mapped read-only."""
+    with node.base.repository.open(f"{name}.npy", "rb") as handle:
+        # Loose objects are stored as plain .npy files, which can be mapped directly.
+        path = getattr(handle, "name", None)
+        if isinstance(handle, io.BufferedReader) and isinstance(path, str):
+            if os.path.isfile(path):
+                return np.load(path, mmap_mode="r")
+
+        # Packed objects are first copied to a temporary file. The file is deleted
+        # right away, its content remains mapped as long as the array exists.
+        directory = get_cache_dir("cube_planes")
+        directory.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".npy") as tmp:
+            while chunk := handle.read(2**20):
+                tmp.write(chunk)
+            tmp.flush()
+            return np.load(tmp.name, mmap_mode="r")
+
+
+def process_cube_planes(node):
+    """Like `stm_tools.process_cube_planes_array`, with memory-mapped planes."""
+    x_arr = np.array(load_array(node, "x_arr"))
+    y_arr = np.array(load_array(node, "y_arr"))
+
+    planes = {}
+    for name in node.get_arraynames():
+        parts = name.split("_")
+        if not name.startswith("cube_") or not parts[1].isnumeric():
+            continue
+        # The number in the name follows the cubegen convention (counting from 1).
+        i_mo = int(parts[1]) - 1
+        i_spin = 1 if len(parts) > 2 and parts[2] == "b" else 0
+
+        planes.setdefault(i_mo, [None])
+        if i_spin == 1 and len(planes[i_mo]) == 1:
+            planes[i_mo].append(None)
+        planes[i_mo][i_spin] = load_array(node, name)
+
+    x_arr -= np.mean(x_arr)
+    y_arr -= np.mean(y_arr)
+    return {
+        "mo_planes": planes,
+        "dx": x_arr[1] - x_arr[0],
+        "dy": y_arr[1] - y_arr[0],
+        "extent": [x_arr[0], x_arr[-1], y_arr[0], y_arr[-1]],
+        "heights": np.array(load_array(node, "h_arr")),
+    }
+
+
+def _get_planes_size(cpa_dict):
+    return sum(
+        plane.nbytes
+        for planes in cpa_dict["mo_planes"].values()
+        for plane in planes
+        if plane is not None
+    )
+
+
+_cache = LRUCache(maxsize=CACHE_SIZE, getsize=_get_planes_size)
+
+
+def get_cube_planes(node):
+    """Return the processed cube planes of `node`, see `process_cube_planes`."""
+    cpa_dict = _cache.get(node.uuid)
+    if cpa_dict is None:
+        cpa_dict = process_cube_planes(node)
+        _cache.put(node.uuid, cpa_dict)
+    return cpa_dict
+
+
+def get_plane_index(cpa_dict, height):
+    """Return the index of the plane at `height` (Å), within 0.05 Å."""
+    matches = np.isclose(cpa_dict["heights"], height, atol=0.05)
+    if not matches.any():
+        raise ValueError(
+            f"No plane at the height {height} Å, the heights of the planes are "
+            f"{list(cpa_dict['heights'])}."
+        )
+    return int(matches.argmax())
+
+
+def extrapolate_planes(planes, energies, dx, dy, delta_hs, dtype=np.float32):
+    """Extrapolate orbital planes to the heights `delta_hs` (Å) above them.
+
+    Vectorized version of `stm_tools.extrapolate_morb` for the planes of shape
+    (n_orbitals, nx, ny) with the orbital `energies` (eV) with respect to the
+    vacuum level. Returns an array of shape (n_orbitals, n_heights, nx, ny) of
+    type `dtype`. The heights are computed one at a time, so that the temporary
+    arrays only hold the maps of one height.
+    """
+    shape = planes.shape[1:]
+    fourier = np.fft.rfft2(planes)
+
+    # k in 1/bohr, energies in Hartree. Unbound states are not decaying.
+    kx_arr = 2 * np.pi * np.fft.fftfreq(shape[0], dx * ANG_TO_BOHR)
+    ky_arr = 2 * np.pi * np.fft.rfftfreq(shape[1], dy * ANG_TO_BOHR)
+    k2_grid = kx_arr[:, np.newaxis] ** 2 + ky_arr[np.newaxis, :] ** 2
+    energies = np.minimum(np.asarray(energies) / HART_2_EV, 0.0)
+    kappa = np.sqrt(k2_grid - 2 * energies[:, np.newaxis, np.newaxis])
+
+    delta_hs = np.asarray(delta_hs) * ANG_TO_BOHR
+    maps = np.empty((len(planes), len(delta_hs)) + shape, dtype=dtype)
+    for i_h, delta_h in enumerate(delta_hs):
+        maps[:, i_h] = np.fft.irfft2(fourier * np.exp(-kappa * delta_h), s=shape)
+    return maps
+
+
+class SpmMaps:
+    """Orbital maps of all the orbitals of some cube planes on a grid of heights.
+
+    The maps are all computed at once, so that the orbitals, spins, kinds and
+    heights can then be browsed without any further computation.
+    """
+
+    def __init__(self, cpa_dict, sop, extrap_h, heights):
+        self.sop = sop
+        self.extent = cpa_dict["extent"]
+        self.heights = np.asarray(heights)
+
+        # The orbitals are extrapolated from the plane at the `extrap_h` height.
+        i_plane = get_plane_index(cpa_dict, extrap_h)
+        self.orbitals = []  # (i_mo, i_spin) of each of the maps
+        planes = []
+        for i_mo, spin_planes in sorted(cpa_dict["mo_planes"].items()):
+            for i_spin, plane in enumerate(spin_planes):
+                if plane is not None:
+                    self.orbitals.append((i_mo, i_spin))
+                    planes.append(plane[:, :, i_plane])
+        self.energies = np.array(
+            [sop["moenergies"][i_spin][i_mo] for i_mo, i_spin in self.orbitals]
+        )
+        self.maps = extrapolate_planes(
+            np.array(planes),
+            self.energies,
+            cpa_dict["dx"],
+            cpa_dict["dy"],
+            self.heights - extrap_h,
+        )
+
+    @staticmethod
+    def get_height_nbytes(cpa_dict):
+        """Return the size (bytes) of the maps of all the orbitals at one height."""
+        planes = [
+            plane
+            for spin_planes in cpa_dict["mo_planes"].values()
+            for plane in spin_planes
+            if plane is not None
+        ]
+        if not planes:
+            return 0
+        nx, ny = planes[0].shape[:2]
+        return len(planes) * nx * ny * np.dtype(np.float32).itemsize
+
+    @property
+    def nbytes(self):
+        return self.maps.nbytes
+
+    def get_map(self, i_mo, i_spin, h, kind="orb", fwhm=0.05):
+        """Return the map of the given kind ('orb', 'orb2' or 'sts') closest to `h`."""
+        i_h = np.abs(self.heights - h).argmin()
+        if kind == "sts":
+            delta_e = self.energies - self.sop["moenergies"][i_spin][i_mo]
+            selected = np.abs(delta_e) <= 1.5 * fwhm
+            weights = import_stm_tools().gaussian(delta_e[selected], fwhm)
+            return np.einsum("i,ixy->xy", weights, self.maps[selected, i_h] ** 2)
+
+        orb_map = self.maps[self.orbitals.index((i_mo, i_spin)), i_h]
+        return orb_map**2 if kind == "orb2" else orb_map
+
+    def plot(self, i_mo, i_spin, h, kind="orb", fwhm=0.05):
+        """Plot a map, like `stm_tools.plot_mapping`."""
+        import matplotlib.pyplot as plt
+
+        if (i_mo, i_spin) not in self.orbitals:
+            print(f"MO{i_mo + 1} was not computed for spin {i_spin}.")
+            return
+
+        h = self.heights[np.abs(self.heights - h).argmin()]
+        energy = self.sop["moenergies"][i_spin][i_mo]
+        rel_homo_label = import_stm_tools().get_rel_homo_label(
+            i_mo, self.sop["homos"][i_spin]
+        )
+        data = self.get_map(i_mo, i_spin, h, kind=kind, fwhm=fwhm)
+        imshow_args = {"cmap": "seismic", "extent": self.extent, "origin": "lower"}
+        if kind == "sts":
+            label = f"STS h{h:.1f} at E={energy:.2f}"
+        else:
+            power = "^2" if kind == "orb2" else ""
+            label = f"MO{i_mo + 1}{power} s{i_spin} {rel_homo_label}\n"
+            label += f"h{h:.1f} E={energy:.2f}"
+        if kind == "orb":
+            amax = np.max(np.abs(data))
+            imshow_args.update(vmin=-amax, vmax=amax)
+
+        ax = plt.gca()
+        ax.imshow(data.T, **imshow_args)
+        ax.set_title(label, loc="left")
+        ax.axis("off")
+        plt.show()
+
+
+_maps_cache = LRUCache(maxsize=MAPS_CACHE_SIZE, getsize=lambda maps: maps.nbytes)
+
+
+def get_spm_maps(node, sop, extrap_h, heights):
+    """Return the `SpmMaps` of the cube planes `node`, computed only once.
+
+    If the maps at all the `heights` would not fit in the cache, only every
+    n-th height is computed, so that they are not evicted as soon as they are
+    cached (the maps are then shown at the closest computed height).
+    """
+    cpa_dict = get_cube_planes(node)
+    heights = np.asarray(heights)
+    height_nbytes = max(SpmMaps.get_height_nbytes(cpa_dict), 1)
+    max_heights = max(MAPS_CACHE_SIZE // height_nbytes, 1)
+    heights = heights[:: -(-len(heights) // max_heights)]
+
+    key = (node.uuid, float(extrap_h), tuple(np.round(heights, 4)))
+    maps = _maps_cache.get(key)
+    if maps is None:
+        maps = SpmMaps(cpa_dict, sop, extrap_h, heights)
+        # Maps larger than the cache would evict all the other maps, and themselves.
+        if maps.nbytes <= MAPS_CACHE_SIZE:
+            _maps_cache.put(key, maps)
+    return maps
@@ -0,0 +1,118 @@
+"""Export of the search results to CSV or JSON Lines files.
+
+The matching work chains are fetched in batches of `BATCH_SIZE`, ordered by PK
+(each batch starting after the last PK of the previous one), and written while
+they are fetched. The memory used thus does not depend on the number of work
+chains.
+"""
+
+import csv
+import json
+
+from aiida import orm
+
+from .search_index import get_opt_energies
+
+BATCH_SIZE = 500
+
+FORMATS = {"csv": "CSV", "jsonl": "JSON Lines"}
+
+COLUMNS = ["pk", "uuid", "formula", "functional", "basis_set"]
+
+
+def _get_filters(filters):
+    return {
+        "attributes.process_label": "GaussianSpinWorkChain",
+        **(filters or {}),
+    }
+
+
+def get_multiplicities(filters=None):
+    """Return the multiplicities optimized by any of the matching work chains."""
+    qb = orm.QueryBuilder()
+    qb.append(orm.WorkChainNode, filters=_get_filters(filters), tag="wc")
+    qb.append(
+        orm.Float,
+        with_incoming="wc",
+        edge_filters={"label": {"like": "m%_opt_energy"}},
+        edge_project="label",
+    )
+    qb.distinct()
+    return sorted({int(label[1 : -len("_opt_energy")]) for label in qb.all(flat=True)})
+
+
+def iter_rows(filters=None, batch_size=BATCH_SIZE):
+    """Yield the matching work chains, with their optimized energy per multiplicity."""
+    last_pk = 0
+    while True:
+        qb = orm.QueryBuilder()
+        qb.append(
+            orm.WorkChainNode,
+            filters={"and": [_get_filters(filters), {"id": {">": last_pk}}]},
+            project=["id", "uuid", "extras.formula"],
+            tag="wc",
+        )
+        for label in ["functional", "basis_set_opt"]:
+            qb.append(
+                orm.Str,
+                with_outgoing="wc",
+                edge_filters={"label": label},
+                project="attributes.value",
+            )
+        qb.order_by({"wc": {"id": "asc"}}).limit(batch_size)
+        batch = qb.all()
+        if not batch:
+            return
+
+        energies = get_opt_energies([row[0] for row in batch])
+        for pk, uuid, formula, functional, basis_set in batch:
+            yield {
+                "pk": pk,
+                "uuid": uuid,
+                "formula": formula,
+                "functional": functional,
+                "basis_set": basis_set,
+                "energies": energies[pk],
+            }
+        last_pk = batch[-1][0]
+
+
+def write_csv(rows, file, multiplicities):
+    """Write the rows with one energy (eV) column per multiplicity.
+
+    The energies of the multiplicities that are not in `multiplicities` (e.g.
+    computed by a work chain that finished during the export) are left out.
+    """
+    energy_columns = {mult: f"m{mult}_energy" for mult in multiplicities}
+    writer = csv.DictWriter(file, COLUMNS + list(energy_columns.values()))
+    writer.writeheader()
+    n_rows = 0
+    for row in rows:
+        energies = row.pop("energies")
+        row.update(
+            {column: energies.get(mult) for mult, column in energy_columns.items()}
+        )
+        writer.writerow(row)
+        n_rows += 1
+    return n_rows
+
+
+def write_jsonl(rows, file):
+    """Write one JSON object per row, with the energies (eV) by multiplicity."""
+    n_rows = 0
+    for row in rows:
+        file.write(json.dumps(row) + "\n")
+        n_rows += 1
+    return n_rows
+
+
+def export_work_chains(path, fmt="csv", filters=None, batch_size=BATCH_SIZE):
+    """Write the matching work chains to `path` in the format `fmt` (see FORMATS).
+
+    Returns the number of exported work chains.
+    """
+    rows = iter_rows(filters, batch_size)
+    with open(path, "w", newline="") as file:
+        if fmt == "csv":
+            return write_csv(rows, file, get_multiplicities(filters))
+        return write_jsonl(rows, file)
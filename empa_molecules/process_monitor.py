@@ -0,0 +1,245 @@
+import inspect
+import threading
+import time
+import traceback
+import warnings
+
+import traitlets
+from aiida import orm
+from aiida.manage import get_manager
+
+
+def get_process_tree_pks(process_pk):
+    """Return the PKs of a process and of all the processes it (indirectly) called."""
+    pks = {process_pk}
+    callers = [process_pk]
+    while callers:
+        qb = orm.QueryBuilder()
+        qb.append(orm.ProcessNode, filters={"id": {"in": callers}}, tag="caller")
+        qb.append(
+            orm.ProcessNode,
+            with_incoming="caller",
+            edge_filters={"type": {"like": "call_%"}},
+            project="id",
+        )
+        callers = [pk for pk in qb.all(flat=True) if pk not in pks]
+        pks.update(callers)
+    return pks
+
+
+def get_processes_mtime(pks):
+    """Return the latest modification time of the given processes."""
+    qb = orm.QueryBuilder()
+    qb.append(
+        orm.ProcessNode,
+        filters={"id": {"in": list(pks)}},
+        project=[{"mtime": {"func": "max"}}],
+    )
+    return qb.one()[0]
+
+
+class AiidaProcessBroadcaster:
+    """Receive the process state changes broadcast over the broker of the loaded profile."""
+
+    def __init__(self, communicator):
+        self._communicator = communicator
+
+    @classmethod
+    def from_profile(cls):
+        """Return a broadcaster for the loaded profile, or None if it has no usable broker."""
+        try:
+            return cls(get_manager().get_communicator())
+        except Exception:
+            return None
+
+    def subscribe(self, callback):
+        """Call `callback(pk)` whenever the process with the given PK changes state."""
+        import kiwipy
+
+        def _subscriber(_communicator, _body, sender, _subject, _correlation_id):
+            callback(sender)
+
+        return self._communicator.add_broadcast_subscriber(
+            kiwipy.BroadcastFilter(_subscriber, subject="state_changed.*")
+        )
+
+    def unsubscribe(self, identifier):
+        self._communicator.remove_broadcast_subscriber(identifier)
+
+
+class LocalProcessBroadcaster:
+    """In-process broadcaster, e.g. to drive a `ProcessStateMonitor` in tests."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        with self._lock:
+            identifier = object()
+            self._subscribers[identifier] = callback
+        return identifier
+
+    def unsubscribe(self, identifier):
+        with self._lock:
+            self._subscribers.pop(identifier, None)
+
+    def broadcast(self, pk):
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+        for callback in subscribers:
+            callback(pk)
+
+
+class ProcessStateMonitor(traitlets.HasTraits):
+    """Monitor a process and execute callback functions when its state changes.
+
+    Drop-in replacement for `aiidalab_widgets_base.ProcessMonitor`. When a
+    broadcaster is available, the callbacks only run when the process (or one
+    of the processes it called) broadcasts a state change; the database is then
+    only polled every `max_interval` seconds as a safety net. Otherwise, the
+    process is polled, and the callbacks only run if the latest modification
+    time of the process and of the processes it called changed. The polling
+    interval is `min_interval` as long as the processes were modified within
+    the last `fast_period` seconds, then a tenth of the time since their last
+    modification, up to `max_interval`.
+    """
+
+    value = traitlets.Unicode(allow_none=True)
+
+    def __init__(
+        self,
+        callbacks=None,
+        on_sealed=None,
+        broadcaster=None,
+        min_interval=0.5,
+        max_interval=30.0,
+        fast_period=60.0,
+        **kwargs,
+    ):
+        self.callbacks = [] if callbacks is None else list(callbacks)
+        self.on_sealed = [] if on_sealed is None else list(on_sealed)
+        self.broadcaster = broadcaster
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.fast_period = fast_period
+
+        self._monitor_thread = None
+        self._monitor_thread_stop = threading.Event()
+        self._monitor_thread_lock = threading.Lock()
+        self._process_changed = threading.Event()
+
+        super().__init__(**kwargs)
+
+    @traitlets.observe("value")
+    def _observe_process(self, change):
+        process_uuid = change["new"]
+
+        # stop thread (if running)
+        if self._monitor_thread is not None:
+            with self._monitor_thread_lock:
+                self._monitor_thread_stop.set()
+                self._process_changed.set()
+                self._monitor_thread.join()
+
+        if process_uuid is None:
+            return
+
+        with self._monitor_thread_lock:
+            self._monitor_thread_stop.clear()
+            self._process_changed.clear()
+            self._monitor_thread = threading.Thread(
+                target=self._monitor_process, args=(process_uuid,), daemon=True
+            )
+            self._monitor_thread.start()
+
+    def get_poll_interval(self, idle_time):
+        """Return the polling interval after `idle_time` seconds without changes."""
+        if idle_time <= self.fast_period:
+            return self.min_interval
+        return min(max(idle_time / 10, self.min_interval), self.max_interval)
+
+    def _monitor_process(self, process_uuid):
+        process = orm.load_node(process_uuid)
+
+        disabled_funcs = set()
+
+        def _run(funcs):
+            for func in funcs:
+                # skip all functions that had previously raised an exception
+                if func in disabled_funcs:
+                    continue
+
+                try:
+                    if len(inspect.signature(func).parameters) > 0:
+                        func(process_uuid)
+                    else:
+                        func()
+                except Exception:
+                    warnings.warn(
+                        f"WARNING: The callback function {func.__name__!r} was disabled due to an error:\n{traceback.format_exc()}",
+                        stacklevel=2,
+                    )
+                    disabled_funcs.add(func)
+
+        # Initial update, before connecting to the broker (which might take a while).
+        _run(self.callbacks)
+
+        broadcaster = self.broadcaster or AiidaProcessBroadcaster.from_profile()
+        process_tree_pks = get_process_tree_pks(process.pk)
+
+        def _on_state_changed(pk):
+            if pk in process_tree_pks:
+                self._process_changed.set()
+
+        identifier = None
+        if broadcaster is not None:
+            try:
+                identifier = broadcaster.subscribe(_on_state_changed)
+            except Exception:
+                identifier = None  # fall back to polling
+
+        interval = self.min_interval
+        last_mtime = get_processes_mtime(process_tree_pks)
+        last_change = time.monotonic()
+        try:
+            while not process.is_sealed:
+                if identifier is not None:
+                    changed = self._process_changed.wait(timeout=self.max_interval)
+                    self._process_changed.clear()
+                else:
+                    changed = False
+                    self._monitor_thread_stop.wait(timeout=interval)
+
+                if self._monitor_thread_stop.is_set():
+                    break  # thread was signaled to be stopped
+
+                # A single query tells whether any process of the tree was
+                # modified, the callbacks (e.g. the tree walk) are skipped if not.
+                mtime = get_processes_mtime(process_tree_pks)
+                if not changed and mtime == last_mtime:
+                    interval = self.get_poll_interval(time.monotonic() - last_change)
+                    continue
+
+                # The processes called in the meantime can only appear when
+                # their caller is modified.
+                process_tree_pks = get_process_tree_pks(process.pk)
+                last_mtime = get_processes_mtime(process_tree_pks)
+                last_change = time.monotonic()
+                interval = self.min_interval
+
+                _run(self.callbacks)
+        finally:
+            if identifier is not None:
+                broadcaster.unsubscribe(identifier)
+
+        # Final update:
+        _run(self.callbacks)
+
+        # Run special 'on_sealed' callback functions in case that process is sealed.
+        if process.is_sealed:
+            _run(self.on_sealed)
+
+    def join(self):
+        if self._monitor_thread is not None:
+            self._monitor_thread.join()
@@ -0,0 +1,339 @@
+"""Estimation of the computational resources of a GaussianSpinWorkChain.
+
+Two log-linear models are fitted on the finished work chains of the profile:
+one for the wall time of the longest Gaussian calculation of a work chain, one
+for its peak memory. The features are the number of atoms and of electrons, the
+highest multiplicity, the basis set and the functional (one-hot encoded) and,
+for the wall time, the number of MPI tasks. The confidence band is derived from
+the spread of the residuals. A prediction is a single dot product, cheap enough
+to be evaluated on every change of the inputs.
+"""
+
+import collections
+
+import ase.data
+import numpy as np
+from aiida import orm
+
+# Minimum number of finished work chains needed to fit the models.
+MIN_SAMPLES = 10
+
+# The band covers about 90% of the training work chains (normal residuals).
+CONFIDENCE_Z = 1.645
+
+# Wall time (s) that the recommended number of MPI tasks should keep the
+# calculations under, to avoid long queuing times.
+TARGET_WALL_TIME = 12 * 3600
+
+# Ridge regularization of the coefficients, to cope with collinear features
+# (e.g. the numbers of atoms and of electrons).
+REGULARIZATION = 1e-3
+
+
+def _get_peak_memory_kb(detailed_job_info):
+    """Return the largest MaxRSS (kB) of the `sacct` output of a SLURM job, if any."""
+    if not detailed_job_info or not detailed_job_info.get("stdout"):
+        return None
+    lines = detailed_job_info["stdout"].splitlines()
+    header = lines[0].split("|")
+    if "MaxRSS" not in header:
+        return None
+    column = header.index("MaxRSS")
+    units = {"K": 1, "M": 1024, "G": 1024**2, "T": 1024**3}
+    peak = None
+    for line in lines[1:]:
+        fields = line.split("|")
+        if len(fields) <= column or not fields[column]:
+            continue
+        value = fields[column]
+        if value[-1] in units:
+            kb = float(value[:-1]) * units[value[-1]]
+        else:
+            kb = float(value) / 1024
+        peak = kb if peak is None else max(peak, kb)
+    return peak
+
+
+def _get_gaussian_calculations(root_pks):
+    """Return the finished Gaussian calculations called (indirectly) by the roots.
+
+    The call tree is walked level by level for all the roots at once, with one
+    query per level. Returns, per root PK, a list of (calculation PK, resources,
+    max_memory_kb, detailed_job_info).
+    """
+    calculations = {pk: [] for pk in root_pks}
+    roots = {pk: pk for pk in root_pks}
+    while roots:
+        qb = orm.QueryBuilder()
+        qb.append(
+            orm.ProcessNode,
+            filters={"id": {"in": list(roots)}},
+            project="id",
+            tag="caller",
+        )
+        qb.append(
+            orm.ProcessNode,
+            with_incoming="caller",
+            edge_filters={"type": {"like": "call_%"}},
+            project=[
+                "id",
+                "attributes.process_label",
+                "attributes.exit_status",
+                "attributes.resources",
+                "attributes.max_memory_kb",
+                "attributes.detailed_job_info",
+            ],
+        )
+        callees = {}
+        for caller, pk, label, exit_status, *options in qb.iterall():
+            if label == "GaussianCalculation":
+                if exit_status == 0:
+                    calculations[roots[caller]].append((pk, *options))
+            else:
+                callees[pk] = roots[caller]
+        roots = callees
+    return calculations
+
+
+def get_training_data():
+    """Return the features and the resources used by the finished work chains.
+
+    The successful GaussianSpinWorkChains and their inputs are fetched with a
+    single query, the Gaussian calculations they ran and their wall times with a
+    few more, independently of the number of work chains. Without a peak memory
+    reported by the scheduler, the memory that was requested (and sufficed) is
+    used.
+    """
+    qb = orm.QueryBuilder()
+    qb.append(
+        orm.WorkChainNode,
+        filters={
+            "attributes.process_label": "GaussianSpinWorkChain",
+            "attributes.exit_status": 0,
+        },
+        project="id",
+        tag="wc",
+    )
+    qb.append(
+        orm.StructureData,
+        with_outgoing="wc",
+        edge_filters={"label": "structure"},
+        project=["attributes.kinds", "attributes.sites"],
+    )
+    for label in ["functional", "basis_set_opt"]:
+        qb.append(
+            orm.Str,
+            with_outgoing="wc",
+            edge_filters={"label": label},
+            project="attributes.value",
+        )
+    qb.append(
+        orm.List,
+        with_outgoing="wc",
+        edge_filters={"label": "multiplicity_list"},
+        project="attributes.list",
+    )
+    work_chains = qb.all()
+    if not work_chains:
+        return []
+    calculations = _get_gaussian_calculations([row[0] for row in work_chains])
+    calc_pks = [calc[0] for calcs in calculations.values() for calc in calcs]
+    if not calc_pks:
+        return []
+
+    qb = orm.QueryBuilder()
+    qb.append(
+        orm.CalcJobNode,
+        filters={"id": {"in": calc_pks}},
+        project="id",
+        tag="calc",
+    )
+    qb.append(
+        orm.Dict,
+        with_incoming="calc",
+        edge_filters={"label": "output_parameters"},
+        project="attributes.metadata.wall_time",
+    )
+    wall_times = dict(qb.all())
+
+    samples = []
+    for pk, kinds, sites, functional, basis_set, multiplicities in work_chains:
+        sample = {"wall_time": None, "memory_kb": None}
+        for calc_pk, resources, max_memory_kb, detailed_job_info in calculations[pk]:
+            if not wall_times.get(calc_pk):
+                continue
+            # The wall time is reported for each link of the Gaussian job.
+            wall_time = float(np.sum(wall_times[calc_pk]))
+            sample["wall_time"] = max(sample["wall_time"] or 0, wall_time)
+            sample["n_mpi_tasks"] = resources.get("tot_num_mpiprocs", 1)
+            memory_kb = _get_peak_memory_kb(detailed_job_info) or max_memory_kb
+            if memory_kb:
+                sample["memory_kb"] = max(sample["memory_kb"] or 0, memory_kb)
+        if sample["wall_time"] is None:
+            continue
+
+        symbols = {kind["name"]: kind["symbols"][0] for kind in kinds}
+        sample.update(
+            {
+                "n_atoms": len(sites),
+                "n_electrons": sum(
+                    ase.data.atomic_numbers[symbols[site["kind_name"]]]
+                    for site in sites
+                ),
+                "multiplicity": max(multiplicities),
+                "functional": functional.lower(),
+                "basis_set": basis_set.lower(),
+            }
+        )
+        samples.append(sample)
+    return samples
+
+
+class LogLinearModel:
+    """Least-squares fit of the logarithm of a target on the given features."""
+
+    def __init__(self, samples, target, numeric, categorical):
+        self.numeric = numeric
+        # The most common value of each categorical feature is the reference one.
+        self.categorical = {
+            name: [
+                value
+                for value, _ in collections.Counter(
+                    sample[name] for sample in samples
+                ).most_common()
+            ]
+            for name in categorical
+        }
+        samples = [sample for sample in samples if sample[target]]
+        if not samples:
+            raise ValueError(f"No sample has a {target!r} to fit the model on.")
+        x = np.array([self._encode(sample) for sample in samples])
+        y = np.log([sample[target] for sample in samples])
+
+        penalty = REGULARIZATION * np.eye(x.shape[1])
+        penalty[0, 0] = 0.0  # the intercept is not regularized
+        self.coefficients = np.linalg.solve(x.T @ x + penalty, x.T @ y)
+        residuals = y - x @ self.coefficients
+        n_dof = max(len(y) - np.linalg.matrix_rank(x), 1)
+        self.sigma = np.sqrt(residuals @ residuals / n_dof)
+        self.n_samples = len(y)
+
+    def _encode(self, sample):
+        features = [1.0] + [np.log(sample[name]) for name in self.numeric]
+        for name, values in self.categorical.items():
+            # Values not seen during the fit are treated as the reference one.
+            features += [float(sample[name] == value) for value in values[1:]]
+        return features
+
+    def predict(self, sample):
+        """Return the estimate and the lower and upper bounds of its band."""
+        log_estimate = np.dot(self._encode(sample), self.coefficients)
+        margin = CONFIDENCE_Z * self.sigma
+        return tuple(
+            float(np.exp(value))
+            for value in (log_estimate, log_estimate - margin, log_estimate + margin)
+        )
+
+
+class ResourceEstimator:
+    """Estimate the wall time (s) and the memory (kB) of a GaussianSpinWorkChain.
+
+    A resource is only estimated if at least MIN_SAMPLES work chains reported it,
+    its model is None otherwise.
+    """
+
+    NUMERIC = ["n_atoms", "n_electrons", "multiplicity"]
+    CATEGORICAL = ["functional", "basis_set"]
+
+    def __init__(self, samples):
+        self.n_samples = len(samples)
+        self.mpi_tasks_choices = sorted({sample["n_mpi_tasks"] for sample in samples})
+        self.wall_time_model = self._fit(
+            samples, "wall_time", self.NUMERIC + ["n_mpi_tasks"]
+        )
+        self.memory_model = self._fit(samples, "memory_kb", self.NUMERIC)
+
+    @classmethod
+    def _fit(cls, samples, target, numeric):
+        if sum(1 for sample in samples if sample[target]) < MIN_SAMPLES:
+            return None
+        return LogLinearModel(samples, target, numeric, cls.CATEGORICAL)
+
+    @classmethod
+    def from_database(cls):
+        """Fit the estimator on the finished work chains, None if there are too few."""
+        samples = get_training_data()
+        if len(samples) < MIN_SAMPLES:
+            return None
+        estimator = cls(samples)
+        if estimator.wall_time_model is None and estimator.memory_model is None:
+            return None
+        return estimator
+
+    @staticmethod
+    def get_features(inputs, n_mpi_tasks):
+        """Return the features of the inputs (nodes) of a GaussianSpinWorkChain."""
+        atoms = inputs["structure"].get_ase()
+        return {
+            "n_atoms": len(atoms),
+            "n_electrons": int(atoms.get_atomic_numbers().sum()),
+            "multiplicity": max(inputs["multiplicity_list"].get_list()),
+            "functional": inputs["functional"].value.lower(),
+            "basis_set": inputs["basis_set_opt"].value.lower(),
+            "n_mpi_tasks": n_mpi_tasks,
+        }
+
+    def estimate(self, features):
+        """Return the (estimate, low, high) wall time (s) and memory (kB).
+
+        A resource that cannot be estimated is None.
+        """
+        return {
+            name: None if model is None else model.predict(features)
+            for name, model in [
+                ("wall_time", self.wall_time_model),
+                ("memory_kb", self.memory_model),
+            ]
+        }
+
+    def recommend_mpi_tasks(self, features):
+        """Return the number of MPI tasks to request.
+
+        It is the smallest number used before for which the upper bound of the
+        wall time stays below TARGET_WALL_TIME, None if the wall time cannot be
+        estimated.
+        """
+        if self.wall_time_model is None:
+            return None
+        for n_mpi_tasks in self.mpi_tasks_choices:
+            _, _, high = self.wall_time_model.predict(
+                dict(features, n_mpi_tasks=n_mpi_tasks)
+            )
+            if high <= TARGET_WALL_TIME:
+                return n_mpi_tasks
+        return self.mpi_tasks_choices[-1]
+
+
+_estimator = None
+_estimator_n_samples = None
+
+
+def get_estimator():
+    """Return the estimator, fitted again when the finished work chains changed."""
+    global _estimator, _estimator_n_samples
+
+    qb = orm.QueryBuilder()
+    qb.append(
+        orm.WorkChainNode,
+        filters={
+            "attributes.process_label": "GaussianSpinWorkChain",
+            "attributes.exit_status": 0,
+        },
+    )
+    n_samples = qb.count()
+    if n_samples != _estimator_n_samples:
+        _estimator = (
+            ResourceEstimator.from_database() if n_samples >= MIN_SAMPLES else None
+        )
+        _estimator_n_samples = n_samples
+    return _estimator
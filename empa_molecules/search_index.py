@@ -0,0 +1,296 @@
+"""Denormalized, queryable extras of the finished GaussianSpinWorkChains.
+
+The search filters on these extras instead of traversing the provenance graph:
+
+* `formula`: Hill formula of the structure. It is written at submission for all
+  the work chains, see `set_formula`, so that the running and failed ones can
+  be found too, and from the ground-state structure once finished.
+* `elements`: sorted list of the chemical elements.
+* `n_atoms`: number of atoms.
+* `gs_energy`: ground-state energy (eV).
+* `gs_multiplicity`: ground-state spin multiplicity.
+* `spin_gap`: energy (eV) of the lowest state of another multiplicity with
+  respect to the ground state (only if several multiplicities were computed).
+* `calculation_hash`: hash of the structure and of the calculation parameters,
+  to find an identical calculation before submitting a new one.
+
+All work chains can be (re)indexed with:
+
+    python -m empa_molecules.search_index
+"""
+
+import hashlib
+import json
+
+import numpy as np
+from aiida import orm
+from aiida.manage import get_manager
+
+from .utils import get_ase_from_attributes, get_formula_from_attributes
+
+INDEX_VERSION = 2
+
+# Extra marking the work chains that were indexed.
+INDEX_VERSION_KEY = "search_index_version"
+
+
+# Str inputs of the GaussianSpinWorkChain that define the calculation, together
+# with the structure and the multiplicity list.
+CALCULATION_PARAMETERS = [
+    "functional",
+    "empirical_dispersion",
+    "basis_set_opt",
+    "basis_set_scf",
+]
+
+
+def get_calculation_hash(kinds, sites, parameters):
+    """Return the hash of a calculation on a structure with the given parameters.
+
+    The hash does not depend on the order of the atoms, on the position of the
+    molecule, on the case of the parameters or on the order of the multiplicities.
+    """
+    atoms = get_ase_from_attributes(kinds, sites)
+    positions = atoms.positions - atoms.positions.mean(axis=0)
+    # Adding 0.0 turns -0.0 into 0.0.
+    positions = (np.round(positions, 3) + 0.0).tolist()
+    canonical = {
+        "structure": sorted(zip(atoms.get_chemical_symbols(), positions)),
+        "multiplicity_list": sorted(parameters.get("multiplicity_list") or []),
+    }
+    for name in CALCULATION_PARAMETERS:
+        canonical[name] = (parameters.get(name) or "").strip().lower()
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+def get_inputs_calculation_hash(inputs):
+    """Return the calculation hash of the inputs (nodes) of a GaussianSpinWorkChain."""
+    structure = inputs["structure"]
+    parameters = {
+        name: inputs[name].value for name in CALCULATION_PARAMETERS if name in inputs
+    }
+    parameters["multiplicity_list"] = inputs["multiplicity_list"].get_list()
+    return get_calculation_hash(
+        structure.base.attributes.get("kinds"),
+        structure.base.attributes.get("sites"),
+        parameters,
+    )
+
+
+def find_finished_calculation(calculation_hash):
+    """Return the latest successful GaussianSpinWorkChain with the given hash, if any."""
+    qb = orm.QueryBuilder()
+    qb.append(
+        orm.WorkChainNode,
+        filters={
+            "attributes.process_label": "GaussianSpinWorkChain",
+            "attributes.exit_status": 0,
+            "extras.calculation_hash": calculation_hash,
+        },
+    )
+    qb.order_by({orm.WorkChainNode: {"ctime": "desc"}}).limit(1)
+    return qb.first(flat=True)
+
+
+def _get_calculation_hashes(pks):
+    """Return the calculation hashes of the given work chains."""
+    qb = orm.QueryBuilder()
+    qb.append(orm.WorkChainNode, filters={"id": {"in": pks}}, project="id", tag="wc")
+    labels = CALCULATION_PARAMETERS + ["multiplicity_list", "structure"]
+    qb.append(
+        orm.Data,
+        with_outgoing="wc",
+        edge_filters={"label": {"in": labels}},
+        edge_project="label",
+        project="attributes",
+    )
+    inputs = {pk: {} for pk in pks}
+    for pk, attributes, label in qb.iterall():
+        inputs[pk][label] = attributes
+
+    hashes = {}
+    for pk, attributes in inputs.items():
+        structure = attributes.pop("structure")
+        # Str nodes store a `value`, List nodes a `list`.
+        parameters = {
+            label: value.get("value", value.get("list"))
+            for label, value in attributes.items()
+        }
+        hashes[pk] = get_calculation_hash(
+            structure["kinds"], structure["sites"], parameters
+        )
+    return hashes
+
+
+def get_opt_energies(pks):
+    """Return the optimized energy per multiplicity of the given work chains."""
+    qb = orm.QueryBuilder()
+    qb.append(orm.WorkChainNode, filters={"id": {"in": pks}}, project="id", tag="wc")
+    qb.append(
+        orm.Float,
+        with_incoming="wc",
+        edge_filters={"label": {"like": "m%_opt_energy"}},
+        edge_project="label",
+        project="attributes.value",
+    )
+    energies = {pk: {} for pk in pks}
+    for pk, value, label in qb.iterall():
+        energies[pk][int(label[1 : -len("_opt_energy")])] = value
+    return energies
+
+
+def get_index_extras(
+    kinds, sites, gs_energy, gs_multiplicity, opt_energies, calculation_hash
+):
+    symbols = {kind["name"]: kind["symbols"][0] for kind in kinds}
+    extras = {
+        "calculation_hash": calculation_hash,
+        "formula": get_formula_from_attributes(kinds, sites),
+        "elements": sorted(set(symbols.values())),
+        "n_atoms": len(sites),
+        "gs_energy": gs_energy,
+        "gs_multiplicity": gs_multiplicity,
+        INDEX_VERSION_KEY: INDEX_VERSION,
+    }
+    excited = [
+        energy
+        for multiplicity, energy in opt_energies.items()
+        if multiplicity != gs_multiplicity
+    ]
+    if excited:
+        extras["spin_gap"] = min(excited) - gs_energy
+    return extras
+
+
+def index_work_chains(incremental=True, batch_size=200):
+    """Write the search extras of the finished GaussianSpinWorkChains.
+
+    In incremental mode, only the work chains that were not indexed yet, or
+    indexed by an older version, are processed. The work chains are fetched in
+    batches ordered by PK, the extras of each batch are written in a single
+    transaction. Returns the number of indexed work chains.
+    """
+    filters = {
+        "attributes.process_label": "GaussianSpinWorkChain",
+        "attributes.exit_status": 0,
+    }
+    if incremental:
+        filters["or"] = [
+            {"extras": {"!has_key": INDEX_VERSION_KEY}},
+            {f"extras.{INDEX_VERSION_KEY}": {"<": INDEX_VERSION}},
+        ]
+
+    storage = get_manager().get_profile_storage()
+    n_work_chains = 0
+    last_pk = 0
+    while True:
+        # Page through the work chains by PK, so that only one batch is in memory.
+        qb = orm.QueryBuilder()
+        qb.append(
+            orm.WorkChainNode,
+            filters={**filters, "id": {">": last_pk}},
+            project="id",
+            tag="wc",
+        )
+        qb.append(
+            orm.StructureData,
+            with_incoming="wc",
+            edge_filters={"label": "gs_structure"},
+            project=["attributes.kinds", "attributes.sites"],
+        )
+        qb.append(
+            orm.Float,
+            with_incoming="wc",
+            edge_filters={"label": "gs_energy"},
+            project="attributes.value",
+        )
+        qb.append(
+            orm.Int,
+            with_incoming="wc",
+            edge_filters={"label": "gs_multiplicity"},
+            project="attributes.value",
+        )
+        qb.order_by({"wc": {"id": "asc"}}).limit(batch_size)
+        batch = qb.all()  # fetch the whole batch first, its extras are modified below
+        if not batch:
+            return n_work_chains
+
+        pks = [row[0] for row in batch]
+        opt_energies = get_opt_energies(pks)
+        calculation_hashes = _get_calculation_hashes(pks)
+        nodes = {
+            node.pk: node
+            for node in orm.QueryBuilder()
+            .append(orm.WorkChainNode, filters={"id": {"in": pks}})
+            .all(flat=True)
+        }
+        with storage.transaction():
+            for pk, kinds, sites, gs_energy, gs_multiplicity in batch:
+                nodes[pk].base.extras.set_many(
+                    get_index_extras(
+                        kinds,
+                        sites,
+                        gs_energy,
+                        gs_multiplicity,
+                        opt_energies[pk],
+                        calculation_hashes[pk],
+                    )
+                )
+        n_work_chains += len(batch)
+        last_pk = pks[-1]
+
+
+def set_formula(work_chain, structure=None):
+    """Write the `formula` extra of a submitted work chain from its input structure."""
+    if structure is None:
+        structure = work_chain.inputs.structure
+    work_chain.base.extras.set("formula", structure.get_formula())
+
+
+def index_formulas(batch_size=200):
+    """Write the `formula` extra of the GaussianSpinWorkChains that do not have it.
+
+    This covers the work chains submitted before `set_formula` was called at
+    submission. Returns the number of updated work chains.
+    """
+    filters = {
+        "attributes.process_label": "GaussianSpinWorkChain",
+        "extras": {"!has_key": "formula"},
+    }
+    storage = get_manager().get_profile_storage()
+    n_work_chains = 0
+    last_pk = 0
+    while True:
+        qb = orm.QueryBuilder()
+        qb.append(
+            orm.WorkChainNode,
+            filters={**filters, "id": {">": last_pk}},
+            project=["id", "*"],
+            tag="wc",
+        )
+        qb.append(
+            orm.StructureData,
+            with_outgoing="wc",
+            edge_filters={"label": "structure"},
+            project=["attributes.kinds", "attributes.sites"],
+        )
+        qb.order_by({"wc": {"id": "asc"}}).limit(batch_size)
+        batch = qb.all()  # fetch the whole batch first, its extras are modified below
+        if not batch:
+            return n_work_chains
+
+        with storage.transaction():
+            for _, node, kinds, sites in batch:
+                node.base.extras.set(
+                    "formula", get_formula_from_attributes(kinds, sites)
+                )
+        n_work_chains += len(batch)
+        last_pk = batch[-1][0]
+
+
+if __name__ == "__main__":
+    from aiida import load_profile
+
+    load_profile()
+    print(f"Indexed {index_work_chains(incremental=False)} work chains.")
+    print(f"Set the formula of {index_formulas()} other work chains.")
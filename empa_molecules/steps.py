@@ -1,13 +1,38 @@
+import datetime
+import math
+import traceback
+import warnings
+
 import aiidalab_widgets_base as awb
 import ipywidgets as ipw
 import traitlets as tr
 from aiida import engine, orm, plugins
 
-from .widgets import NodeViewWidget
+from . import tracing
+from .campaign import Campaign, read_structures
+from .process_monitor import ProcessStateMonitor
+from .resource_estimator import get_estimator
+from .search_index import (
+    find_finished_calculation,
+    get_inputs_calculation_hash,
+    index_work_chains,
+    set_formula,
+)
 
 StructureData = plugins.DataFactory("structure")
 GaussianSpinWorkChain = plugins.WorkflowFactory("nanotech_empa.gaussian.spin")
 
+# The scheduler is asked for more memory than Gaussian.
+SCHEDULER_MEMORY_FACTOR = 1.25
+
+
+def get_process_inputs(process):
+    """Return the input nodes of a process by link label, with a single query."""
+    qb = orm.QueryBuilder()
+    qb.append(orm.ProcessNode, filters={"id": process.pk}, tag="process")
+    qb.append(orm.Node, with_outgoing="process", edge_project="label", project="*")
+    return {label: node for node, label in qb.iterall()}
+
 
 class StructureSelectionStep(ipw.VBox, awb.WizardAppWidgetStep):
     """Integrated widget for the selection of structures from different sources."""
@@ -54,7 +79,7 @@ class StructureSelectionStep(ipw.VBox, awb.WizardAppWidgetStep):
                 self.manager,
                 self.confirm_button,
             ],
-            **kwargs
+            **kwargs,
         )
 
     @tr.default("state")
@@ -92,6 +117,15 @@ class StructureSelectionStep(ipw.VBox, awb.WizardAppWidgetStep):
     def can_reset(self):
         return self.confirmed_structure is not None
 
+    def load_from_process(self, process, inputs=None):
+        """Show the structure of a GaussianSpinWorkChain as confirmed."""
+        if inputs is None:
+            inputs = get_process_inputs(process)
+        with self.hold_trait_notifications():
+            with self.manager.hold_sync(), self.hold_sync():
+                self.confirmed_structure = inputs["structure"]
+                self.manager.input_structure = inputs["structure"]
+
     def reset(self):  # unconfirm
         self.confirmed_structure = None
         self.manager.structure = None
@@ -174,7 +208,7 @@ class ConfigureGaussianCalculationStep(ipw.VBox, awb.WizardAppWidgetStep):
                 self.multiplicity_list,
                 self.confirm_button,
             ],
-            **kwargs
+            **kwargs,
         )
 
     def reset(self):
@@ -187,6 +221,21 @@ class ConfigureGaussianCalculationStep(ipw.VBox, awb.WizardAppWidgetStep):
         else:
             self.state = self.State.INIT
 
+    def load_from_process(self, process, inputs=None):
+        """Show the configuration of a GaussianSpinWorkChain as confirmed."""
+        if inputs is None:
+            inputs = get_process_inputs(process)
+        with self.hold_trait_notifications():
+            self.dft_functional.value = inputs["functional"].value
+            self.empirical_dispersion.value = inputs["empirical_dispersion"].value
+            self.basis_set_opt.value = inputs["basis_set_opt"].value
+            self.basis_set_scf.value = inputs["basis_set_scf"].value
+            self.multiplicity_list.value = " ".join(
+                map(str, inputs["multiplicity_list"].get_list())
+            )
+            self.state = self.State.SUCCESS
+        self.confirm_button.disabled = True
+
     def confirm(self, _=None):
         self.inputs = {
             "functional": orm.Str(self.dft_functional.value),
@@ -251,19 +300,87 @@ class SubmitGaussianCalculationStep(ipw.VBox, awb.WizardAppWidgetStep):
             style={"description_width": "100px"},
         )
 
+        # Resources estimated from the finished work chains.
+        self.estimator = None
+        self._resources_features = None
+        self._memory_estimate = None
+        self.resources_estimate = ipw.HTML()
+
         # We update the step's state whenever there is a change to the configuration or the order status.
         self.observe(self._update_state, ["inputs"])
 
+        self.observe(self._estimate_resources, ["inputs"])
+        self.n_mpi_tasks_widget.observe(self._estimate_run_time, ["value"])
+
+        # Identical calculation that already finished successfully.
+        self.duplicate = None
+        self.duplicate_info = ipw.HTML()
+        self.show_duplicate_button = ipw.Button(
+            description="Show it", button_style="info", layout={"display": "none"}
+        )
+        self.show_duplicate_button.on_click(self._show_duplicate)
+        self.observe(self._find_duplicate, ["inputs"])
+
         self.btn_submit_mol_opt = awb.SubmitButtonWidget(
             GaussianSpinWorkChain, inputs_generator=self.prepare_spin_calc
         )
         self.btn_submit_mol_opt.btn_submit.disabled = True
+        self.btn_submit_mol_opt.on_submitted(set_formula)
         tr.dlink(
             (self.btn_submit_mol_opt, "process"),
             (self, "value"),
             transform=lambda x: x.uuid if x else None,
         )
 
+        # Campaign: the same calculation for many structures.
+        self.campaign = None
+        self.campaign_file = ipw.FileUpload(
+            description="Structures file", accept=".xyz,.extxyz,.cif,.pdb,.sdf"
+        )
+        self.campaign_smiles = ipw.Textarea(
+            description="SMILES:", placeholder="One SMILES per line (requires rdkit)"
+        )
+        self.campaign_group_label = ipw.Text(
+            description="Group:",
+            value=f"campaign_{datetime.datetime.now():%Y%m%d_%H%M}",
+        )
+        self.campaign_max_active = ipw.BoundedIntText(
+            description="Max. running:",
+            value=10,
+            min=1,
+            max=1000,
+            tooltip="Maximum number of work chains running at once on the Gaussian computer",
+        )
+        self.campaign_submit_button = ipw.Button(
+            description="Submit campaign", button_style="success", disabled=True
+        )
+        self.campaign_submit_button.on_click(self._submit_campaign)
+        self.campaign_stop_button = ipw.Button(description="Stop", disabled=True)
+        self.campaign_stop_button.on_click(lambda _: self.campaign.stop())
+        self.campaign_status = ipw.HTML()
+        campaign = ipw.Accordion(
+            children=[
+                ipw.VBox(
+                    [
+                        ipw.HTML(
+                            "Submit the configured calculation for each of the "
+                            "structures of a file and/or a list of SMILES."
+                        ),
+                        self.campaign_file,
+                        self.campaign_smiles,
+                        self.campaign_group_label,
+                        self.campaign_max_active,
+                        ipw.HBox(
+                            [self.campaign_submit_button, self.campaign_stop_button]
+                        ),
+                        self.campaign_status,
+                    ]
+                )
+            ],
+            selected_index=None,
+        )
+        campaign.set_title(0, "Campaign")
+
         super().__init__(
             [
                 ipw.HBox(
@@ -284,9 +401,12 @@ class SubmitGaussianCalculationStep(ipw.VBox, awb.WizardAppWidgetStep):
                         ),
                     ]
                 ),
+                self.resources_estimate,
+                ipw.HBox([self.duplicate_info, self.show_duplicate_button]),
                 self.btn_submit_mol_opt,
+                campaign,
             ],
-            **kwargs
+            **kwargs,
         )
 
     def reset(self):
@@ -312,12 +432,175 @@ class SubmitGaussianCalculationStep(ipw.VBox, awb.WizardAppWidgetStep):
             self.state = self.State.INIT
             self.btn_submit_mol_opt.btn_submit.disabled = True
 
+        self.campaign_submit_button.disabled = (
+            self.btn_submit_mol_opt.btn_submit.disabled
+            or (self.campaign is not None and self.campaign.running)
+        )
+
+    def load_from_process(self, process, inputs=None):
+        """Show the codes and resources of a GaussianSpinWorkChain, and select it."""
+        if inputs is None:
+            inputs = get_process_inputs(process)
+        with self.hold_trait_notifications():
+            try:
+                self.gaussian_code_dropdown.value = inputs["gaussian_code"].uuid
+                self.formchk_code_dropdown.value = inputs["formchk_code"].uuid
+                self.cubegen_code_dropdown.value = inputs["cubegen_code"].uuid
+            except (KeyError, tr.TraitError):
+                pass
+
+            if "options" in inputs:
+                options = inputs["options"].get_dict()
+                self.n_mpi_tasks_widget.value = options["resources"]["tot_num_mpiprocs"]
+                self.memory_widget.value = round(
+                    options["max_memory_kb"] / 1024 / SCHEDULER_MEMORY_FACTOR
+                )
+                self.run_time_widget.value = round(
+                    options["max_wallclock_seconds"] / 60
+                )
+            self.state = self.State.SUCCESS
+            self.value = process.uuid
+
+    def _estimate_resources(self, _=None):
+        # The estimate is only a hint, it must never prevent submitting.
+        try:
+            self._fill_in_estimated_resources()
+        except Exception:
+            self._resources_features = None
+            self.resources_estimate.value = "The resources could not be estimated."
+            warnings.warn(
+                f"The resources could not be estimated:\n{traceback.format_exc()}",
+                stacklevel=2,
+            )
+
+    def _fill_in_estimated_resources(self):
+        """Pre-fill the resources with the upper bounds of their estimates."""
+        self._resources_features = None
+        self.estimator = get_estimator() if self.inputs else None
+        if self.estimator is None:
+            self.resources_estimate.value = (
+                "Not enough finished calculations to estimate the resources."
+                if self.inputs
+                else ""
+            )
+            return
+
+        self._resources_features = self.estimator.get_features(
+            self.inputs, self.n_mpi_tasks_widget.value
+        )
+        # The memory is requested to Gaussian, the scheduler gets more.
+        memory_kb = self.estimator.estimate(self._resources_features)["memory_kb"]
+        self._memory_estimate = None
+        if memory_kb is not None:
+            self._memory_estimate = [
+                kb / SCHEDULER_MEMORY_FACTOR / 1024 for kb in memory_kb
+            ]
+            self.memory_widget.value = math.ceil(self._memory_estimate[2])
+        n_mpi_tasks = self.estimator.recommend_mpi_tasks(self._resources_features)
+        if n_mpi_tasks is not None:
+            self.n_mpi_tasks_widget.value = n_mpi_tasks
+        self._estimate_run_time()
+
+    def _estimate_run_time(self, _=None):
+        if self._resources_features is None:
+            return
+        self._resources_features["n_mpi_tasks"] = self.n_mpi_tasks_widget.value
+        estimates = []
+        wall_time = self.estimator.estimate(self._resources_features)["wall_time"]
+        if wall_time is not None:
+            run_time = [seconds / 60 for seconds in wall_time]
+            self.run_time_widget.value = math.ceil(run_time[2])
+            estimates.append(
+                f"runtime {run_time[0]:.0f} min "
+                f"({run_time[1]:.0f}-{run_time[2]:.0f})"
+            )
+        if self._memory_estimate is not None:
+            estimates.append(
+                f"memory {self._memory_estimate[0]:.0f} MB "
+                f"({self._memory_estimate[1]:.0f}-{self._memory_estimate[2]:.0f})"
+            )
+        self.resources_estimate.value = (
+            f"Estimated from {self.estimator.n_samples} finished calculations: "
+            f"{', '.join(estimates)}."
+        )
+
+    def _find_duplicate(self, _=None):
+        self.duplicate = None
+        if self.inputs:
+            # Index the work chains that finished in the meantime. Once all the
+            # older ones are indexed (see `search_index`), this is a single query.
+            index_work_chains(incremental=True)
+            self.duplicate = find_finished_calculation(
+                get_inputs_calculation_hash(self.inputs)
+            )
+
+        if self.duplicate is None:
+            self.duplicate_info.value = ""
+            self.show_duplicate_button.layout.display = "none"
+        else:
+            self.duplicate_info.value = (
+                f"An identical calculation (pk: {self.duplicate.pk}, "
+                f"{self.duplicate.ctime:%Y-%m-%d %H:%M}) already finished successfully."
+            )
+            self.show_duplicate_button.layout.display = None
+
+    def _show_duplicate(self, _=None):
+        self.value = self.duplicate.uuid
+        self.state = self.State.SUCCESS
+
+    def _submit_campaign(self, _=None):
+        structures = []
+        for name, upload in self.campaign_file.value.items():
+            structures += read_structures(upload["content"], name)
+        structures += self.campaign_smiles.value.split()
+        if not structures:
+            self.campaign_status.value = "No structures were provided."
+            return
+
+        self.campaign = Campaign(
+            structures,
+            self.get_builder,
+            group_label=self.campaign_group_label.value,
+            computer=orm.load_code(self.gaussian_code_dropdown.value).computer,
+            max_active=self.campaign_max_active.value,
+        )
+        n_structures = len(structures)
+
+        def _update_status(_=None):
+            status = "running" if self.campaign.running else "finished"
+            self.campaign_status.value = (
+                f"Campaign {status}: {self.campaign.n_submitted} of {n_structures} "
+                f"work chains submitted to the group "
+                f"<b>{self.campaign.group.label}</b>, {self.campaign.n_failed} failed."
+            )
+            if self.campaign.errors:
+                self.campaign_status.value += (
+                    f"<br>Last error: {self.campaign.errors[-1]}"
+                )
+            self.campaign_stop_button.disabled = not self.campaign.running
+            self.campaign_submit_button.disabled = (
+                self.campaign.running or self.btn_submit_mol_opt.btn_submit.disabled
+            )
+
+        self.campaign.observe(_update_status, ["n_submitted", "n_failed", "running"])
+        self.campaign.start()
+        _update_status()
+
+    @tracing.traced("prepare_spin_calc")
     def prepare_spin_calc(self):
+        builder = self.get_builder()
+        self.state = self.State.SUCCESS
+        return builder
+
+    def get_builder(self, structure=None):
+        """Return the builder of the configured work chain, optionally for another structure."""
         builder = GaussianSpinWorkChain.get_builder()
 
         # Input nodes.
         for key, value in self.inputs.items():
             builder[key] = value
+        if structure is not None:
+            builder.structure = structure
 
         # Codes.
         builder.gaussian_code = orm.load_code(self.gaussian_code_dropdown.value)
@@ -325,28 +608,31 @@ class SubmitGaussianCalculationStep(ipw.VBox, awb.WizardAppWidgetStep):
         builder.cubegen_code = orm.load_code(self.cubegen_code_dropdown.value)
 
         # Resources.
+        max_memory_kb = int(SCHEDULER_MEMORY_FACTOR * self.memory_widget.value) * 1024
         builder.options = orm.Dict(
             dict={
                 "resources": {
                     "num_machines": 1,
                     "tot_num_mpiprocs": self.n_mpi_tasks_widget.value,
                 },
-                "max_memory_kb": int(1.25 * self.memory_widget.value) * 1024,
+                "max_memory_kb": max_memory_kb,
                 "max_wallclock_seconds": 60 * self.run_time_widget.value,
             }
         )
 
-        self.state = self.State.SUCCESS
-
         return builder
 
 
 class ViewGaussianWorkChainStatusAndResultsStep(ipw.VBox, awb.WizardAppWidgetStep):
     value = tr.Unicode(allow_none=True)
 
-    def __init__(self, **kwargs):
+    def __init__(self, broadcaster=None, **kwargs):
+        # The widgets module pulls in the viewers of the results (and their
+        # dependencies), only import it when the results step is created.
+        from .widgets import NodeViewWidget, ProcessTreeWidget
+
         self.process = None
-        self.process_tree = awb.ProcessNodesTreeWidget()
+        self.process_tree = ProcessTreeWidget()
         ipw.dlink((self, "value"), (self.process_tree, "value"))
 
         self.node_view = NodeViewWidget(layout={"width": "auto", "height": "auto"})
@@ -357,13 +643,15 @@ class ViewGaussianWorkChainStatusAndResultsStep(ipw.VBox, awb.WizardAppWidgetSte
         )
         self.process_status = ipw.VBox(children=[self.process_tree, self.node_view])
 
-        # Setup process monitor
-        self.process_monitor = awb.ProcessMonitor(
-            timeout=0.2,
+        # Setup process monitor. The process tree is only updated when the process
+        # broadcasts a state change (or, without a broker, when the polling finds
+        # a modified process), and only the modified processes are re-rendered.
+        self.process_monitor = ProcessStateMonitor(
             callbacks=[
                 self.process_tree.update,
                 self._update_state,
             ],
+            broadcaster=broadcaster,
         )
         ipw.dlink((self, "value"), (self.process_monitor, "value"))
 
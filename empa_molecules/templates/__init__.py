@@ -0,0 +1,13 @@
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def get_environment():
+    import jinja2
+
+    return jinja2.Environment(loader=jinja2.PackageLoader("empa_molecules"))
+
+
+def get_template(name):
+    """Return the template `name`, compiled only once per process."""
+    return get_environment().get_template(name)
@@ -0,0 +1,160 @@
+"""On-disk cache of the structure thumbnails shown in the search results.
+
+Thumbnails are stored as PNG files named after a hash of the chemical symbols
+and positions of the structure, so identical molecules share one thumbnail.
+The least recently used files are evicted when the cache exceeds its size limit.
+
+Thumbnails stored as `thumbnail` extras by earlier versions of the app can be
+moved into the cache with:
+
+    python -m empa_molecules.thumbnails
+"""
+
+import functools
+import hashlib
+import os
+import pathlib
+import tempfile
+import threading
+from base64 import b64decode, b64encode
+
+import numpy as np
+from aiida import orm
+
+from .utils import get_ase_from_attributes, get_cache_dir
+
+
+def get_thumbnail_key(atoms):
+    """Return the cache key of the thumbnail of `atoms`."""
+    digest = hashlib.sha256()
+    digest.update(" ".join(atoms.get_chemical_symbols()).encode())
+    # Round the positions to be insensitive to numerical noise, adding 0.0 turns -0.0 into 0.0.
+    digest.update((np.round(atoms.positions, 4) + 0.0).tobytes())
+    return digest.hexdigest()
+
+
+class ThumbnailCache:
+    """Directory of base64-encoded PNG thumbnails with LRU eviction."""
+
+    def __init__(self, directory=None, max_size=100 * 1024**2):
+        self.directory = pathlib.Path(directory or get_cache_dir("thumbnails"))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size  # bytes
+        self._lock = threading.Lock()
+        self._size = sum(path.stat().st_size for path in self._files())
+
+    def _files(self):
+        return self.directory.glob("*.png")
+
+    def _path(self, key):
+        return self.directory / f"{key}.png"
+
+    def get(self, key):
+        """Return the thumbnail stored under `key`, or None if it is not cached."""
+        path = self._path(key)
+        try:
+            raw = path.read_bytes()
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        return b64encode(raw).decode()
+
+    def put(self, key, thumbnail):
+        raw = b64decode(thumbnail)
+        # Write to a temporary file first, so that readers never see a partial file.
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory, suffix=".tmp", delete=False
+        ) as tmp:
+            tmp.write(raw)
+        path = self._path(key)
+        try:
+            replaced_size = path.stat().st_size
+        except FileNotFoundError:
+            replaced_size = 0
+        os.replace(tmp.name, path)
+
+        with self._lock:
+            self._size += len(raw) - replaced_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        # The directory may be shared with other processes, so rescan it.
+        files = []
+        for path in self._files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        self._size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self._size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
+
+
+@functools.lru_cache(maxsize=None)
+def get_thumbnail_cache():
+    """Return the thumbnail cache shared by the whole process."""
+    return ThumbnailCache()
+
+
+def migrate_thumbnail_extras(cache=None, batch_size=500):
+    """Move the `thumbnail` extras of the nodes into the thumbnail cache.
+
+    The nodes are processed in batches ordered by PK. The thumbnails of the
+    work chains with a ground state structure are cached (the others cannot
+    be keyed) and the extras are removed from all the nodes. Returns the number
+    of nodes whose extra was removed.
+    """
+    cache = cache or get_thumbnail_cache()
+
+    n_nodes = 0
+    last_pk = 0
+    while True:
+        qb = orm.QueryBuilder()
+        qb.append(
+            orm.Node,
+            filters={"extras": {"has_key": "thumbnail"}, "id": {">": last_pk}},
+            project=["id", "extras.thumbnail"],
+            tag="node",
+        )
+        qb.order_by({"node": {"id": "asc"}}).limit(batch_size)
+        batch = qb.all()
+        if not batch:
+            return n_nodes
+
+        qb = orm.QueryBuilder()
+        qb.append(
+            orm.WorkChainNode,
+            filters={"id": {"in": [pk for pk, _ in batch]}},
+            project="id",
+            tag="work_chain",
+        )
+        qb.append(
+            orm.StructureData,
+            with_incoming="work_chain",
+            edge_filters={"label": "gs_structure"},
+            project=["attributes.kinds", "attributes.sites"],
+        )
+        structures = {pk: (kinds, sites) for pk, kinds, sites in qb.all()}
+
+        for pk, thumbnail in batch:
+            if pk in structures:
+                key = get_thumbnail_key(get_ase_from_attributes(*structures[pk]))
+                if cache.get(key) is None:
+                    cache.put(key, thumbnail)
+            orm.load_node(pk).base.extras.delete("thumbnail")
+        n_nodes += len(batch)
+        last_pk = batch[-1][0]
+
+
+if __name__ == "__main__":
+    from aiida import load_profile
+
+    load_profile()
+    print(f"Migrated {migrate_thumbnail_extras()} thumbnails.")
@@ -0,0 +1,136 @@
+"""Lightweight timing of the main entry points of the app.
+
+The entry points are decorated with `traced` (or wrapped in `span`), which
+records their durations while the tracing is enabled. When it is disabled (the
+default), the only overhead is the check of a global flag. The tracing can be
+switched at runtime with `set_enabled`, or enabled at start-up with the
+`EMPA_MOLECULES_TRACING` environment variable. The recorded timings are shown
+by `widgets.TimingsPanel`.
+"""
+
+import collections
+import contextlib
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Number of the most recent durations kept per span, for the percentiles.
+MAX_SAMPLES = 1000
+
+_enabled = bool(os.environ.get("EMPA_MOLECULES_TRACING"))
+_lock = threading.Lock()
+_spans = {}
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def record(name, duration):
+    """Record a duration (s) of the span `name`."""
+    with _lock:
+        entry = _spans.get(name)
+        if entry is None:
+            entry = _spans[name] = {
+                "count": 0,
+                "total": 0.0,
+                "durations": collections.deque(maxlen=MAX_SAMPLES),
+            }
+        entry["count"] += 1
+        entry["total"] += duration
+        entry["durations"].append(duration)
+
+
+@contextlib.contextmanager
+def span(name):
+    """Record the duration of the block as the span `name`."""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def traced(name):
+    """Record the duration of each call of the decorated function as `name`.
+
+    For generator functions, the span lasts until the generator is exhausted.
+    """
+
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not _enabled:
+                    return (yield from func(*args, **kwargs))
+                start = time.perf_counter()
+                try:
+                    return (yield from func(*args, **kwargs))
+                finally:
+                    record(name, time.perf_counter() - start)
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not _enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def get_stats():
+    """Return the count, total and statistics (s) of the recorded spans."""
+    with _lock:
+        spans = {
+            name: (entry["count"], entry["total"], np.array(entry["durations"]))
+            for name, entry in _spans.items()
+        }
+
+    stats = {}
+    for name, (count, total, durations) in sorted(spans.items()):
+        p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+        stats[name] = {
+            "count": count,
+            "total": total,
+            "mean": total / count,
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            "max": float(durations.max()),
+        }
+    return stats
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+
+
+def export_json():
+    """Return the statistics of the recorded spans as a JSON string."""
+    return json.dumps(
+        {"percentiles_of_last": MAX_SAMPLES, "spans": get_stats()},
+        indent=2,
+    )
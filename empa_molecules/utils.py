@@ -1,12 +1,247 @@
+import collections
+import contextlib
+import functools
+import io
+import multiprocessing
+import os
+import pathlib
+import sys
+import threading
+import time
 from base64 import b64encode
-from tempfile import NamedTemporaryFile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 import ase
+from aiida.orm.nodes.data.structure import get_formula, get_symbols_string
+from IPython import get_ipython
+
+from . import tracing
+
+
+class LRUCache:
+    """Thread-safe mapping that keeps the most recently used entries.
+
+    The total size of the entries is limited to `maxsize`. The size of an entry
+    is `getsize(value)`, or 1 if `getsize` is None (i.e. `maxsize` is then the
+    number of entries).
+    """
+
+    def __init__(self, maxsize, getsize=None):
+        self.maxsize = maxsize
+        self.getsize = getsize
+        self.size = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _getsize(self, value):
+        return 1 if self.getsize is None else self.getsize(value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._data:
+                self.size -= self._getsize(self._data.pop(key))
+            self._data[key] = value
+            self.size += self._getsize(value)
+            while self.size > self.maxsize:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= self._getsize(evicted)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data.pop(key)
+            self.size -= self._getsize(value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+
+class _ThreadStdout:
+    """Stream that captures the text written by one thread and forwards the rest."""
+
+    def __init__(self, stream, thread, outputs):
+        self._stream = stream
+        self._thread = thread
+        self._outputs = outputs
+
+    def write(self, text):
+        if threading.current_thread() is not self._thread:
+            return self._stream.write(text)
+        if self._outputs and self._outputs[-1].get("name") == "stdout":
+            self._outputs[-1]["text"] += text
+        else:
+            self._outputs.append(
+                {"output_type": "stream", "name": "stdout", "text": text}
+            )
+        return len(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _ThreadDisplayPublisher:
+    """Display publisher that captures the objects displayed by one thread."""
+
+    def __init__(self, display_pub, thread, outputs):
+        self._display_pub = display_pub
+        self._thread = thread
+        self._outputs = outputs
+
+    def publish(self, data, metadata=None, **kwargs):
+        if threading.current_thread() is not self._thread:
+            return self._display_pub.publish(data, metadata=metadata, **kwargs)
+        self._outputs.append(
+            {"output_type": "display_data", "data": data, "metadata": metadata or {}}
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._display_pub, name)
+
+
+_capture_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def capture_thread_output(outputs):
+    """Append what the current thread prints and displays to `outputs`.
+
+    The outputs are in the format of the `outputs` trait of `ipw.Output`, so that
+    they can be cached and shown again. Unlike the context manager of
+    `ipw.Output`, this also works outside of a notebook. The other threads print
+    and display as usual.
+    """
+    thread = threading.current_thread()
+    shell = get_ipython()
+    with _capture_lock:
+        stdout = sys.stdout
+        sys.stdout = _ThreadStdout(stdout, thread, outputs)
+        if shell is not None:
+            display_pub = shell.display_pub
+            shell.display_pub = _ThreadDisplayPublisher(display_pub, thread, outputs)
+        try:
+            yield outputs
+        finally:
+            sys.stdout = stdout
+            if shell is not None:
+                shell.display_pub = display_pub
+
+
+def get_cache_dir(name):
+    """Return the directory of the app's cache `name`, following the XDG convention."""
+    cache_home = os.environ.get("XDG_CACHE_HOME", pathlib.Path.home() / ".cache")
+    return pathlib.Path(cache_home) / "empa_molecules" / name
+
+
+def import_postprocessing():
+    """Import the Gaussian post-processing module, which pulls in matplotlib.
+
+    The plotting libraries are only needed once a finished work chain is viewed,
+    so they are not imported when the app starts.
+    """
+    import aiida_nanotech_empa.utils.gaussian_wcs_postprocess as pp
+
+    return pp
+
+
+def import_stm_tools():
+    import aiida_nanotech_empa.utils.stm_tools as stm
+
+    return stm
 
 
 def render_thumbnail(atoms):
-    tmp = NamedTemporaryFile()
-    ase.io.write(tmp.name, atoms, format="png")
-    raw = open(tmp.name, "rb").read()
-    tmp.close()
-    return b64encode(raw).decode()
+    import ase.io
+
+    buffer = io.BytesIO()
+    ase.io.write(buffer, atoms, format="png")
+    return b64encode(buffer.getvalue()).decode()
+
+
+def downsample_image(content, size):
+    """Return a PNG preview of the image `content` that fits into `size` x `size` pixels."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(content)) as image:
+        image.thumbnail((size, size))
+        buffer = io.BytesIO()
+        image.save(buffer, format="png")
+    return buffer.getvalue()
+
+
+def parse_cube_image_name(name):
+    """Parse the name of an image of the cubegen pymol parser.
+
+    The names are '{orbital}[_{spin}]_{label}_iv{isovalue}_{view}.png' for the
+    orbitals and e.g. 'spin_iv{isovalue}_{view}.png' for the densities.
+    """
+    parts = name[: -len(".png")].split("_")
+    return {
+        "name": name,
+        "orbital": int(parts[0]) if parts[0].isnumeric() else None,
+        "label": " ".join(part for part in parts[:-1] if not part.startswith("iv")),
+        "view": parts[-1],
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def get_thumbnail_executor():
+    """Return the process pool shared by all thumbnail renderings."""
+    # Spawn the workers instead of forking the (multi-threaded) kernel process.
+    return ProcessPoolExecutor(
+        max_workers=min(4, os.cpu_count() or 1),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def submit_thumbnail(atoms):
+    """Render the thumbnail of `atoms` in the background, return a future."""
+    try:
+        future = get_thumbnail_executor().submit(render_thumbnail, atoms)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed by the OS), start a new pool.
+        get_thumbnail_executor.cache_clear()
+        future = get_thumbnail_executor().submit(render_thumbnail, atoms)
+
+    if tracing.is_enabled():
+        # The rendering happens in a worker process, the span also includes the
+        # time spent waiting for a free worker.
+        start = time.perf_counter()
+        future.add_done_callback(
+            lambda _: tracing.record("render_thumbnail", time.perf_counter() - start)
+        )
+    return future
+
+
+def get_formula_from_attributes(kinds, sites, mode="hill"):
+    """Return the formula of a StructureData from its `kinds` and `sites` attributes.
+
+    Equivalent to `StructureData.get_formula`, but works on attributes projected
+    by a QueryBuilder, so that the node itself does not need to be loaded.
+    """
+    symbols = {
+        kind["name"]: get_symbols_string(kind["symbols"], kind["weights"])
+        for kind in kinds
+    }
+    return get_formula([symbols[site["kind_name"]] for site in sites], mode=mode)
+
+
+def get_ase_from_attributes(kinds, sites):
+    """Return the ase.Atoms (without cell) of a molecule from its StructureData attributes."""
+    symbols = {kind["name"]: kind["symbols"][0] for kind in kinds}
+    return ase.Atoms(
+        symbols=[symbols[site["kind_name"]] for site in sites],
+        positions=[site["position"] for site in sites],
+    )
@@ -1,19 +1,40 @@
 import datetime
-import importlib
+import json
+import re
 import threading
-from dataclasses import dataclass
+import traceback
+from base64 import b64encode
+from concurrent.futures import as_completed
+from dataclasses import dataclass, field
 
-import aiida_nanotech_empa.utils.gaussian_wcs_postprocess as pp
-import aiida_nanotech_empa.utils.stm_tools as stm
 import aiidalab_widgets_base as awb
 import ipywidgets as ipw
-import jinja2
+import numpy as np
 import traitlets
 from aiida import engine, orm
-from aiida.cmdline.utils.query.calculation import CalculationQueryBuilder
+from aiida.tools.query.formatting import format_state
+from aiidalab_widgets_base.nodes import AiidaProcessNodeTreeNode, NodesTreeWidget
 from IPython.display import clear_output, display
 
-from .utils import render_thumbnail
+from . import tracing
+from .comparison import Comparison
+from .cube_planes import get_cube_planes, get_spm_maps
+from .export import FORMATS as EXPORT_FORMATS
+from .export import export_work_chains
+from .search_index import index_work_chains
+from .templates import get_template
+from .thumbnails import get_thumbnail_cache, get_thumbnail_key
+from .utils import (
+    LRUCache,
+    capture_thread_output,
+    downsample_image,
+    get_ase_from_attributes,
+    get_cache_dir,
+    get_formula_from_attributes,
+    import_postprocessing,
+    parse_cube_image_name,
+    submit_thumbnail,
+)
 
 
 class NodeViewWidget(ipw.VBox):
@@ -32,8 +53,63 @@ class NodeViewWidget(ipw.VBox):
                     display(awb.viewer(change["new"]))
 
 
+class IncrementalNodesTreeWidget(NodesTreeWidget):
+    """`NodesTreeWidget` only re-rendering the processes modified since the last update.
+
+    The modification times of all the processes shown in the tree are fetched
+    with a single query. Only the modified processes are reloaded, and their
+    children only rebuilt if they are shown (called processes and outputs can
+    only appear when their caller is modified).
+    """
+
+    def update(self, _=None):
+        tree_nodes = {}
+        for root_node in self._tree.nodes:
+            for tree_node in self._walk_tree(root_node):
+                if isinstance(tree_node, AiidaProcessNodeTreeNode):
+                    tree_nodes[tree_node.pk] = tree_node
+        if not tree_nodes:
+            return
+
+        qb = orm.QueryBuilder()
+        qb.append(
+            orm.ProcessNode,
+            filters={"id": {"in": list(tree_nodes)}},
+            project=["id", "mtime"],
+        )
+        root_pks = {root_node.pk for root_node in self._tree.nodes}
+        for pk, mtime in qb.iterall():
+            tree_node = tree_nodes[pk]
+            if getattr(tree_node, "_mtime", None) == mtime:
+                continue
+            if pk in root_pks or tree_node.nodes:
+                self._build_tree(tree_node)
+            if tree_node.outputs_node.nodes:
+                self._build_tree(tree_node.outputs_node)
+            self._update_tree_node(tree_node)
+            tree_node._mtime = mtime
+
+
+class ProcessTreeWidget(awb.ProcessNodesTreeWidget):
+    """Process tree updated incrementally, see `IncrementalNodesTreeWidget`."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._tree = IncrementalNodesTreeWidget()
+        self._tree.observe(self._observe_tree_selected_nodes, ["selected_nodes"])
+        self.children = [self._tree]
+
+
 class WorkChainSelectorWidget(ipw.HBox):
-    # The PK of a 'aiida.workflows:quantumespresso.pw.bands' WorkChainNode.
+    """Typeahead picker of the GaussianSpinWorkChains.
+
+    The search text is turned into database filters, see `get_query_filters`,
+    and only the `PAGE_SIZE` latest matching work chains are listed, more pages
+    being fetched on demand. The options sent to the browser thus do not grow
+    with the number of work chains in the database.
+    """
+
+    # The UUID of the selected GaussianSpinWorkChain.
     value = traitlets.Unicode(allow_none=True)
 
     # When this trait is set to a positive value, the work chains are automatically
@@ -48,10 +124,30 @@ class WorkChainSelectorWidget(ipw.HBox):
     # use `None` as setting the widget's value to None will lead to "no selection".
     _NO_PROCESS = object()
 
-    FMT_WORKCHAIN = "{wc.pk:6}{wc.ctime:>10}\t{wc.state:<16}\t{wc.formula}"
+    FMT_WORKCHAIN = "{wc.pk:6}  {wc.ctime}\t{wc.state:<16}\t{wc.formula}"
+
+    PAGE_SIZE = 20
+
+    # Delay (s) after the last keystroke before the work chains are searched.
+    SEARCH_DELAY = 0.3
+
+    PROCESS_STATES = [
+        "created",
+        "waiting",
+        "running",
+        "finished",
+        "excepted",
+        "killed",
+    ]
 
     def __init__(self, **kwargs):
         self.work_chains_prompt = ipw.HTML("<b>Select workflow or start new:</b>&nbsp;")
+        self.search_text = ipw.Text(
+            placeholder="PK, formula, state or date (YYYY-MM-DD)",
+            continuous_update=True,
+            layout=ipw.Layout(width="260px"),
+        )
+        self.search_text.observe(self._observe_search_text, "value")
         self.work_chains_selector = ipw.Dropdown(
             options=[("New workflow...", self._NO_PROCESS)],
             layout=ipw.Layout(min_width="300px", flex="1 1 auto"),
@@ -62,10 +158,24 @@ class WorkChainSelectorWidget(ipw.HBox):
             transform=lambda uuid: None if uuid is self._NO_PROCESS else uuid,
         )
 
+        self.more_button = ipw.Button(
+            description="More", tooltip="List older matching work chains"
+        )
+        self.more_button.on_click(self.load_more_work_chains)
         self.refresh_work_chains_button = ipw.Button(description="Refresh")
         self.refresh_work_chains_button.on_click(self.refresh_work_chains)
 
-        self._refresh_lock = threading.Lock()
+        # Matching work chains currently listed (latest first), the selected work
+        # chain if it is not among them, and the most recent modification time of
+        # the matching work chains (used for incremental refreshes).
+        self._work_chains = []
+        self._selected = None
+        self._last_mtime = None
+
+        self._search_timer = None
+        # Reentrant: updating the options can change the value, whose observer
+        # updates the options in turn.
+        self._refresh_lock = threading.RLock()
         self._refresh_thread = None
         self._stop_refresh_thread = threading.Event()
         self._update_auto_refresh_thread_state()
@@ -73,7 +183,9 @@ class WorkChainSelectorWidget(ipw.HBox):
         super().__init__(
             children=[
                 self.work_chains_prompt,
+                self.search_text,
                 self.work_chains_selector,
+                self.more_button,
                 self.refresh_work_chains_button,
             ],
             **kwargs,
@@ -86,25 +198,107 @@ class WorkChainSelectorWidget(ipw.HBox):
         ctime: str
         state: str
         formula: str
+        mtime: datetime.datetime = field(default=None, compare=False, repr=False)
 
     @classmethod
-    def find_work_chains(cls):
-        builder = CalculationQueryBuilder()
-        filters = builder.get_filters(
-            process_label="GaussianSpinWorkChain",
-        )
-        query_set = builder.get_query_set(
+    def get_query_filters(cls, text):
+        """Return the work chain filters matching all the words of the search text.
+
+        A number is a PK, a process state (or "failed") filters on the state, a
+        date (YYYY-MM-DD or YYYY-MM) on the creation day (or month). Any other
+        word, including an invalid date, is searched in the formula, see
+        `search_index.set_formula`.
+        """
+        filters = {"attributes.process_label": "GaussianSpinWorkChain"}
+        conditions = []
+        for word in text.split():
+            if word.isdigit():
+                conditions.append({"id": int(word)})
+            elif word.lower() in cls.PROCESS_STATES:
+                conditions.append({"attributes.process_state": word.lower()})
+            elif word.lower() == "failed":
+                conditions.append({"attributes.exit_status": {">": 0}})
+            elif (ctime_range := cls._get_ctime_range(word)) is not None:
+                conditions.append({"ctime": {"and": ctime_range}})
+            else:
+                conditions.append({"extras.formula": {"like": f"%{word}%"}})
+        if conditions:
+            filters["and"] = conditions
+        return filters
+
+    @staticmethod
+    def _get_ctime_range(word):
+        """Return the filters on the day (YYYY-MM-DD) or month (YYYY-MM) `word`.
+
+        Returns None if the word is not a valid date.
+        """
+        if not re.fullmatch(r"\d{4}-\d{2}(-\d{2})?", word):
+            return None
+        is_day = word.count("-") == 2
+        try:
+            start = datetime.datetime.fromisoformat(word if is_day else f"{word}-01")
+        except ValueError:
+            return None
+        if is_day:
+            end = start + datetime.timedelta(days=1)
+        else:
+            end = (start + datetime.timedelta(days=31)).replace(day=1)
+        return [{">=": start}, {"<": end}]
+
+    @classmethod
+    @tracing.traced("find_work_chains")
+    def find_work_chains(cls, filters=None, limit=None, offset=0):
+        # All columns are fetched in a single query: the formula is computed from
+        # the projected attributes of the input structure, so that no node has
+        # to be loaded.
+        if filters is None:
+            filters = cls.get_query_filters("")
+
+        qb = orm.QueryBuilder()
+        qb.append(
+            orm.WorkChainNode,
             filters=filters,
-            order_by={"ctime": "desc"},
+            project=[
+                "id",
+                "uuid",
+                "ctime",
+                "mtime",
+                "attributes.process_state",
+                "attributes.paused",
+                "attributes.exit_status",
+            ],
+            tag="work_chain",
         )
-        projected = builder.get_projected(
-            query_set, projections=["pk", "uuid", "ctime", "state"]
+        qb.append(
+            orm.StructureData,
+            with_outgoing="work_chain",
+            edge_filters={"label": "structure"},
+            project=["attributes.kinds", "attributes.sites"],
         )
+        qb.order_by({"work_chain": {"id": "desc"}})
+        if limit is not None:
+            qb.limit(limit)
+        if offset:
+            qb.offset(offset)
+
+        for row in qb.iterall():
+            pk, uuid, ctime, mtime, process_state, paused, exit_status = row[:7]
+            yield cls.WorkChainData(
+                pk=pk,
+                uuid=uuid,
+                ctime=ctime.strftime("%Y-%m-%d %H:%M"),
+                state=format_state(process_state, paused, exit_status),
+                formula=get_formula_from_attributes(*row[7:]),
+                mtime=mtime,
+            )
 
-        for process in projected[1:]:
-            uuid = process[0]
-            formula = orm.load_node(uuid).inputs.structure.get_formula()
-            yield cls.WorkChainData(*process, formula=formula)
+    @staticmethod
+    def _get_last_mtime(filters):
+        qb = orm.QueryBuilder()
+        qb.append(
+            orm.WorkChainNode, filters=filters, project=[{"mtime": {"func": "max"}}]
+        )
+        return qb.one()[0]
 
     @traitlets.default("busy")
     def _default_busy(self):
@@ -112,41 +306,103 @@ class WorkChainSelectorWidget(ipw.HBox):
 
     @traitlets.observe("busy")
     def _observe_busy(self, change):
+        # The search text is never disabled, not to interrupt the typing.
         for child in self.children:
-            child.disabled = change["new"]
+            if child is not self.search_text:
+                child.disabled = change["new"]
+
+    @tracing.traced("refresh_work_chains")
+    def refresh_work_chains(self, _=None, incremental=False):
+        """Update the work chain options.
 
-    def refresh_work_chains(self, _=None):
+        The listed pages are fetched again. In incremental mode, this is only done
+        if a matching work chain was created or modified since the last refresh,
+        which is checked with a single aggregate query.
+        """
         with self._refresh_lock:
+            filters = self.get_query_filters(self.search_text.value)
+            last_mtime = self._get_last_mtime(filters)
+            if incremental and last_mtime == self._last_mtime:
+                return
+
             try:
                 self.set_trait("busy", True)  # disables the widget
+                self._last_mtime = last_mtime
+                n_work_chains = max(len(self._work_chains), self.PAGE_SIZE)
+                self._set_work_chains(
+                    list(self.find_work_chains(filters, limit=n_work_chains + 1)),
+                    n_work_chains,
+                )
+            finally:
+                self.set_trait("busy", False)  # reenable the widget
 
-                with self.hold_trait_notifications():
-                    # We need to restore the original value, because it may be reset due to this issue:
-                    # https://github.com/jupyter-widgets/ipywidgets/issues/2230
-                    original_value = self.work_chains_selector.value
+    def load_more_work_chains(self, _=None):
+        """List the next page of matching work chains."""
+        with self._refresh_lock:
+            filters = self.get_query_filters(self.search_text.value)
+            offset = len(self._work_chains)
+            page = list(
+                self.find_work_chains(filters, limit=self.PAGE_SIZE + 1, offset=offset)
+            )
+            self._set_work_chains(self._work_chains + page, offset + self.PAGE_SIZE)
 
-                    self.work_chains_selector.options = [
-                        ("New calculation...", self._NO_PROCESS)
-                    ] + [
-                        (self.FMT_WORKCHAIN.format(wc=wc), wc.uuid)
-                        for wc in self.find_work_chains()
-                    ]
+    def _set_work_chains(self, work_chains, n_work_chains):
+        # One work chain more than listed is fetched to know if there are more.
+        self.more_button.layout.visibility = (
+            "visible" if len(work_chains) > n_work_chains else "hidden"
+        )
+        self._work_chains = work_chains[:n_work_chains]
+        self._update_options()
+
+    def _update_options(self, value=None):
+        work_chains = list(self._work_chains)
+        if value is None:
+            value = self.work_chains_selector.value
+        if value is not self._NO_PROCESS and value not in {
+            wc.uuid for wc in work_chains
+        }:
+            # Keep the selected work chain listed, even if it does not match.
+            if self._selected is None or self._selected.uuid != value:
+                self._selected = next(self.find_work_chains({"uuid": value}), None)
+            if self._selected is not None:
+                work_chains.insert(0, self._selected)
+
+        options = [("New calculation...", self._NO_PROCESS)] + [
+            (self.FMT_WORKCHAIN.format(wc=wc), wc.uuid) for wc in work_chains
+        ]
+        if options == list(self.work_chains_selector.options):
+            return
 
-                    self.work_chains_selector.value = original_value
-            finally:
-                self.set_trait("busy", False)  # reenable the widget
+        with self.hold_trait_notifications():
+            # We need to restore the original value, because it may be reset due to this issue:
+            # https://github.com/jupyter-widgets/ipywidgets/issues/2230
+            self.work_chains_selector.options = options
+            self.work_chains_selector.value = value
+
+    def _observe_search_text(self, _=None):
+        # Searching on every keystroke would send one query per character typed.
+        if self._search_timer is not None:
+            self._search_timer.cancel()
+        self._search_timer = threading.Timer(self.SEARCH_DELAY, self._search)
+        self._search_timer.daemon = True
+        self._search_timer.start()
+
+    def _search(self):
+        self._work_chains = []
+        self.refresh_work_chains()
 
     def _auto_refresh_loop(self):
-        while True:
-            self.refresh_work_chains()
-            if self._stop_refresh_thread.wait(timeout=self.auto_refresh_interval):
-                break
+        self.refresh_work_chains()
+        while not self._stop_refresh_thread.wait(timeout=self.auto_refresh_interval):
+            self.refresh_work_chains(incremental=True)
 
     def _update_auto_refresh_thread_state(self):
         if self.auto_refresh_interval > 0 and self._refresh_thread is None:
             # start thread
             self._stop_refresh_thread.clear()
-            self._refresh_thread = threading.Thread(target=self._auto_refresh_loop)
+            self._refresh_thread = threading.Thread(
+                target=self._auto_refresh_loop, daemon=True
+            )
             self._refresh_thread.start()
 
         elif self.auto_refresh_interval <= 0 and self._refresh_thread is not None:
@@ -172,13 +428,200 @@ class WorkChainSelectorWidget(ipw.HBox):
         new = self._NO_PROCESS if change["new"] is None else change["new"]
 
         if new not in {uuid for _, uuid in self.work_chains_selector.options}:
-            self.refresh_work_chains()
+            # Add the work chain to the options, so that it can be selected.
+            with self._refresh_lock:
+                self._update_options(new)
 
         self.work_chains_selector.value = new
 
+    def close(self):
+        # Stop the auto-refresh thread, otherwise it keeps polling the database
+        # (and keeps this widget alive) after the widget is closed.
+        self.auto_refresh_interval = 0
+        if self._search_timer is not None:
+            self._search_timer.cancel()
+        super().close()
+
+
+class CubeImageGallery(ipw.VBox):
+    """Gallery of the images of a `*_cube_images` output.
+
+    The images are filtered by orbital index and view direction before anything
+    is loaded. Downsampled previews are only made for the page in view, in the
+    background, and an image is shown at full resolution when its preview is
+    clicked.
+    """
+
+    folder = traitlets.Instance(orm.FolderData, allow_none=True)
+
+    PREVIEW_SIZE = 160  # pixels
+    PAGE_SIZE = 12
+
+    # Previews shared by all the galleries of the process, keyed on the folder
+    # UUID and the image name.
+    _previews = LRUCache(maxsize=64 * 1024**2, getsize=len)
+
+    def __init__(self, **kwargs):
+        self._images = []
+        self._selected = []
+        self._page = 0
+        self._updating_filters = False
+
+        self.orbitals = ipw.IntRangeSlider(
+            description="Orbitals:", continuous_update=False
+        )
+        self.orbitals.observe(self._update_selection, names="value")
+        self.view = ipw.Dropdown(description="View:", options=[])
+        self.view.observe(self._update_selection, names="value")
+
+        self.previous_page_button = ipw.Button(icon="chevron-left", disabled=True)
+        self.previous_page_button.on_click(lambda _: self._show_page(self._page - 1))
+        self.next_page_button = ipw.Button(icon="chevron-right", disabled=True)
+        self.next_page_button.on_click(lambda _: self._show_page(self._page + 1))
+        self.page_info = ipw.HTML()
+
+        self._previews_box = ipw.GridBox(
+            layout=ipw.Layout(
+                grid_template_columns=f"repeat(auto-fill, {self.PREVIEW_SIZE + 20}px)"
+            )
+        )
+        self._full_image_title = ipw.HTML()
+        self._full_image = ipw.Image(format="png", layout={"max_width": "100%"})
+
+        super().__init__(
+            children=[
+                ipw.HBox([self.orbitals, self.view]),
+                ipw.HBox(
+                    [self.previous_page_button, self.page_info, self.next_page_button]
+                ),
+                self._previews_box,
+                self._full_image_title,
+                self._full_image,
+            ],
+            **kwargs,
+        )
+
+    @traitlets.observe("folder")
+    def _observe_folder(self, change):
+        self._images = []
+        if change["new"] is not None:
+            self._images = [
+                parse_cube_image_name(name)
+                for name in change["new"].list_object_names()
+                if name.endswith(".png")
+            ]
+
+        # Update the filters without selecting the images for each of them.
+        self._updating_filters = True
+        try:
+            orbitals = [
+                image["orbital"]
+                for image in self._images
+                if image["orbital"] is not None
+            ]
+            self.orbitals.disabled = not orbitals
+            if orbitals:
+                # The bounds are set in an order that keeps min <= max.
+                self.orbitals.max = max(max(orbitals), self.orbitals.min)
+                self.orbitals.min = min(orbitals)
+                self.orbitals.max = max(orbitals)
+                self.orbitals.value = (min(orbitals), max(orbitals))
+
+            views = sorted({image["view"] for image in self._images})
+            self.view.options = views
+            if "z+" in views:
+                self.view.value = "z+"
+        finally:
+            self._updating_filters = False
+        self._update_selection()
+
+    def _update_selection(self, _=None):
+        """Select the images matching the filters, without loading them."""
+        if self._updating_filters:
+            return
+        first, last = self.orbitals.value
+        self._selected = [
+            image
+            for image in self._images
+            if image["view"] == self.view.value
+            and (image["orbital"] is None or first <= image["orbital"] <= last)
+        ]
+        self._full_image_title.value = ""
+        self._full_image.value = b""
+        self._show_page(0)
+
+    def _show_page(self, page):
+        n_pages = max(1, -(-len(self._selected) // self.PAGE_SIZE))
+        self._page = min(max(page, 0), n_pages - 1)
+        start = self._page * self.PAGE_SIZE
+        images = self._selected[start : start + self.PAGE_SIZE]
+
+        previews = []
+        children = []
+        for image in images:
+            preview = ipw.Image(format="png", width=self.PREVIEW_SIZE)
+            button = ipw.Button(
+                description=image["label"],
+                tooltip=image["name"],
+                layout={"width": f"{self.PREVIEW_SIZE}px"},
+            )
+            button.on_click(lambda _, name=image["name"]: self._show_full_image(name))
+            previews.append((image["name"], preview))
+            children.append(ipw.VBox([preview, button]))
+        self._previews_box.children = children
+
+        self.page_info.value = f"&nbsp;Page {self._page + 1} of {n_pages}&nbsp;"
+        self.previous_page_button.disabled = self._page == 0
+        self.next_page_button.disabled = self._page >= n_pages - 1
+
+        # The images are read here, because the file repository must not be
+        # accessed concurrently, only the downsampling is done in the background.
+        missing = []
+        for name, preview in previews:
+            key = (self.folder.uuid, name)
+            content = self._previews.get(key)
+            if content is None:
+                content = self.folder.get_object_content(name, mode="rb")
+                missing.append((key, content, preview))
+            else:
+                preview.value = content
+
+        threading.Thread(
+            target=self._load_previews,
+            args=(self._previews_box.children, missing),
+            daemon=True,
+        ).start()
+
+    def _load_previews(self, page, missing):
+        for key, content, preview in missing:
+            # Stop if another page was selected in the meantime.
+            if page is not self._previews_box.children:
+                return
+            preview.value = downsample_image(content, self.PREVIEW_SIZE)
+            self._previews.put(key, preview.value)
+
+    def _show_full_image(self, name):
+        self._full_image_title.value = f"<b>{name}</b>"
+        self._full_image.value = self.folder.get_object_content(name, mode="rb")
+
 
 @awb.register_viewer_widget("process.workflow.workchain.WorkChainNode.")
 class WorkChainViewer(ipw.VBox):
+    # Outputs rendered in the tabs, shared by all the viewers of the process, so
+    # that coming back to a work chain is instant. Keyed on the work chain PK.
+    _rendered_outputs = LRUCache(maxsize=32)
+
+    LOADING_OUTPUTS = (
+        {
+            "output_type": "display_data",
+            "data": {"text/html": "<i>loading...</i>", "text/plain": "loading..."},
+            "metadata": {},
+        },
+    )
+
+    # Spacing (Å) of the heights of the SPM maps.
+    SPM_HEIGHT_STEP = 0.25
+
     def __init__(self, node, **kwargs):
         if node.process_label != "GaussianSpinWorkChain":
             raise KeyError(str(node.node_type))
@@ -194,10 +637,10 @@ class WorkChainViewer(ipw.VBox):
             """
         )
 
-        # Cube images options.
+        # Cube images options, filled in when the tab is first selected.
         self.cube_files = ipw.Dropdown(
             description="Select orbitals:",
-            options=[out for out in self.node.outputs if "cube_images" in out],
+            options=[],
             value=None,
             style={"description_width": "initial"},
         )
@@ -206,7 +649,7 @@ class WorkChainViewer(ipw.VBox):
         # SPM options.
         self._cube_files_for_spm = ipw.Dropdown(
             description="Select orbitals:",
-            options=[out for out in self.node.outputs if "cube_planes" in out],
+            options=[],
             value=None,
             style={"description_width": "initial"},
         )
@@ -217,7 +660,9 @@ class WorkChainViewer(ipw.VBox):
             options=[],
             style={"description_width": "initial"},
         )
-        self._heights = ipw.FloatSlider(description="Heights:")
+        self._heights = ipw.FloatSlider(
+            description="Heights:", step=self.SPM_HEIGHT_STEP
+        )
         ipw.dlink(
             (self._extrap_planes, "value"),
             (self._heights, "max"),
@@ -240,17 +685,24 @@ class WorkChainViewer(ipw.VBox):
         spm_clear = ipw.Button(description="Clear")
         spm_clear.on_click(self._clear_spm)
 
-        # Displayed Tabs.
+        # Once plotted, the maps of all the orbitals and heights are computed, so
+        # that the plot can follow the controls without any further computation.
+        self._spm_maps = None
+        self._extrap_planes.observe(self._clear_spm, names="value")
+        for control in (self._heights, self._orbitals, self._spin, self._kind):
+            control.observe(self._update_spm_plot, names="value")
+
+        # Displayed Tabs, each rendered when it is first selected.
         self._tabs = ipw.Tab()
         self._tabs.set_title(0, "Summary")
         self._tabs.set_title(1, "Orbitals")
         self._tabs.set_title(2, "SPM")
         self._out_summary = ipw.Output()
-        self._out_orbitals = ipw.Output()
+        self._orbitals_gallery = CubeImageGallery()
         self._out_spm = ipw.Output()
         self._tabs.children = [
             self._out_summary,
-            ipw.VBox([self.cube_files, self._out_orbitals]),
+            ipw.VBox([self.cube_files, self._orbitals_gallery]),
             ipw.VBox(
                 [
                     ipw.HBox([self._cube_files_for_spm, self._heights]),
@@ -261,6 +713,8 @@ class WorkChainViewer(ipw.VBox):
                 ]
             ),
         ]
+        self._rendered_tabs = set()
+        self._tabs.observe(self._render_tab, names="selected_index")
 
         _output = ipw.Output()
 
@@ -283,8 +737,7 @@ class WorkChainViewer(ipw.VBox):
             elif node.process_state is engine.ProcessState.FINISHED:
                 if node.exit_status == 0:
                     display(self._tabs)
-                    with self._out_summary:
-                        pp.make_report(node, nb=True)
+                    self._render_tab()
                 else:
                     display(
                         ipw.HTML(
@@ -297,50 +750,281 @@ class WorkChainViewer(ipw.VBox):
             **kwargs,
         )
 
+    def _render_tab(self, _=None):
+        index = self._tabs.selected_index
+        if index is None or index in self._rendered_tabs:
+            return
+        self._rendered_tabs.add(index)
+
+        if index == 0:
+            self._render_output(
+                self._out_summary,
+                "summary",
+                self._make_report,
+            )
+        elif index == 1:
+            self.cube_files.options = [
+                out for out in self.node.outputs if "cube_images" in out
+            ]
+        elif index == 2:
+            self._cube_files_for_spm.options = [
+                out for out in self.node.outputs if "cube_planes" in out
+            ]
+
+    def _make_report(self):
+        with tracing.span("make_report"):
+            import_postprocessing().make_report(self.node, nb=True)
+
+    def _render_output(self, output, key, func):
+        """Show what `func` prints and displays in `output`.
+
+        The function runs in the main thread, because the report plots with the
+        global state of pyplot, which is not thread-safe. A placeholder is shown
+        meanwhile. The rendered outputs are cached per work chain and `key`.
+        """
+        key = (self.node.pk, key)
+        outputs = self._rendered_outputs.get(key)
+        if outputs is not None:
+            output.outputs = outputs
+            return
+
+        output.outputs = self.LOADING_OUTPUTS
+        outputs = []
+        try:
+            with capture_thread_output(outputs):
+                func()
+        except Exception:
+            outputs.append(
+                {
+                    "output_type": "stream",
+                    "name": "stderr",
+                    "text": traceback.format_exc(),
+                }
+            )
+        else:
+            self._rendered_outputs.put(key, tuple(outputs))
+        output.outputs = tuple(outputs)
+
     def _select_cube_images(self, _=None):
-        with self._out_orbitals:
-            clear_output()
-            pp.plot_cube_images(getattr(self.node.outputs, self.cube_files.value))
+        if self.cube_files.value is not None:
+            self._orbitals_gallery.folder = getattr(
+                self.node.outputs, self.cube_files.value
+            )
 
     def _update_cube_files_for_spm(self, _=None):
+        self._clear_spm()
+        if self._cube_files_for_spm.value is None:
+            return
         cube_planes = getattr(self.node.outputs, self._cube_files_for_spm.value)
-        cpa_dict = stm.process_cube_planes_array(cube_planes)
+        cpa_dict = get_cube_planes(cube_planes)
         self._orbitals.options = [
             (i + 1, i) for i in sorted(cpa_dict["mo_planes"].keys())
         ]
         self._extrap_planes.options = cpa_dict["heights"]
         self._heights.value = self._extrap_planes.value + 3
 
+    @tracing.traced("plot_spm")
     def _plot_spm(self, _=None):
+        selected_planes = self._cube_files_for_spm.value
+        if selected_planes is None:
+            return
+        sop = dict(
+            getattr(
+                self.node.outputs,
+                selected_planes.replace("_cube_planes", "_out_params"),
+            )
+        )
+        extrap_h = self._extrap_planes.value
+        step = self.SPM_HEIGHT_STEP
+        heights = np.arange(extrap_h, self._heights.max + step / 2, step)
         with self._out_spm:
-            selected_planes = self._cube_files_for_spm.value
-            cpa = getattr(self.node.outputs, selected_planes)
-            sop = dict(
-                getattr(
-                    self.node.outputs,
-                    selected_planes.replace("_cube_planes", "_out_params"),
-                )
+            clear_output()
+            print("Computing the maps...")
+            self._spm_maps = get_spm_maps(
+                getattr(self.node.outputs, selected_planes), sop, extrap_h, heights
             )
-            stm.plot_mapping(
-                sop,
-                cpa,
+        self._update_spm_plot()
+
+    @tracing.traced("update_spm_plot")
+    def _update_spm_plot(self, _=None):
+        if self._spm_maps is None or self._orbitals.value is None:
+            return
+        with self._out_spm:
+            clear_output(wait=True)
+            self._spm_maps.plot(
                 self._orbitals.value,
                 self._spin.value,
-                kind=self._kind.value,
                 h=self._heights.value,
-                extrap_h=self._extrap_planes.value,
+                kind=self._kind.value,
                 fwhm=0.05,
             )
 
     def _clear_spm(self, _=None):
+        self._spm_maps = None
         with self._out_spm:
             clear_output()
 
 
+class ComparisonWidget(ipw.VBox):
+    """Sortable table and plot comparing the energies of many work chains.
+
+    The work chains are those of a group or, with `compare(filters)`, those
+    matching the filters (e.g. the ones of a search), see `comparison`.
+    """
+
+    # The work chains are only labelled on the plot below this number.
+    MAX_PLOT_LABELS = 50
+
+    def __init__(self, show_groups=True, **kwargs):
+        self.comparison = None
+
+        self.group = ipw.Dropdown(description="Group:")
+        self.compare_group_button = ipw.Button(description="Compare group")
+        self.compare_group_button.on_click(
+            lambda _: self.compare(group_label=self.group.value)
+        )
+        # Without a group, all the work chains would be compared.
+        ipw.dlink(
+            (self.group, "value"),
+            (self.compare_group_button, "disabled"),
+            transform=lambda label: label is None,
+        )
+        groups = ipw.HBox(
+            [self.group, self.compare_group_button],
+            layout={"display": None if show_groups else "none"},
+        )
+        if show_groups:
+            self.refresh_groups()
+
+        self.sort_by = ipw.Dropdown(description="Sort by:")
+        self.sort_by.observe(self._render, names="value")
+        self.descending = ipw.Checkbox(description="Descending", indent=False)
+        self.descending.observe(self._render, names="value")
+        self.table = ipw.HTML()
+        self.plot = ipw.Output()
+
+        super().__init__(
+            children=[
+                groups,
+                ipw.HBox([self.sort_by, self.descending]),
+                self.table,
+                self.plot,
+            ],
+            **kwargs,
+        )
+
+    def refresh_groups(self):
+        qb = orm.QueryBuilder()
+        qb.append(orm.Group, project="label")
+        qb.order_by({orm.Group: {"label": "asc"}})
+        self.group.options = qb.all(flat=True)
+
+    @tracing.traced("compare")
+    def compare(self, filters=None, group_label=None):
+        """Compare the work chains matching `filters`, in the group `group_label`."""
+        # The formulas are read from the search extras.
+        index_work_chains(incremental=True)
+        self.comparison = Comparison.from_database(filters, group_label)
+
+        sort_by = self.sort_by.value
+        self.sort_by.options = [
+            (name, column)
+            for column, name in self.comparison.get_column_names().items()
+        ]
+        if self.sort_by.value == sort_by:
+            self._render()  # otherwise rendered by the observer
+
+    def _render(self, _=None):
+        if self.comparison is None or self.sort_by.value is None:
+            return
+        order = self.comparison.get_order(self.sort_by.value, self.descending.value)
+
+        # The cells are formatted column by column, the PK is the link.
+        columns = []
+        for name, values in self.comparison.get_columns().items():
+            if name == "pk":
+                continue
+            values = values[order]
+            if values.dtype.kind == "f":
+                fmt = "%d" if name == "gs_multiplicity" else "%.3f"
+                values = np.where(
+                    np.isnan(values), "", np.char.mod(fmt, np.nan_to_num(values))
+                )
+            columns.append(values)
+        with tracing.span("render_comparison"):
+            self.table.value = get_template("comparison.j2").render(
+                column_names=self.comparison.get_column_names(),
+                rows=zip(
+                    self.comparison.uuids[order],
+                    self.comparison.pks[order],
+                    zip(*columns),
+                ),
+                total=len(self.comparison),
+            )
+        self._plot(order)
+
+    def _plot(self, order):
+        import matplotlib.pyplot as plt
+
+        comparison = self.comparison
+        with self.plot:
+            clear_output(wait=True)
+            if not len(comparison):
+                return
+            _, ax = plt.subplots(figsize=(10, 4))
+            x = np.arange(len(order))
+            for i, multiplicity in enumerate(comparison.multiplicities):
+                ax.plot(
+                    x,
+                    comparison.relative_opt_energies[order, i],
+                    "o",
+                    label=f"m{multiplicity}",
+                )
+            if len(order) <= self.MAX_PLOT_LABELS:
+                ax.set_xticks(x)
+                ax.set_xticklabels(
+                    [
+                        f"{pk} {formula}\n{functional}/{basis_set}"
+                        for pk, formula, functional, basis_set in zip(
+                            comparison.pks[order],
+                            comparison.formulas[order],
+                            comparison.functionals[order],
+                            comparison.basis_sets[order],
+                        )
+                    ],
+                    rotation=90,
+                    fontsize="small",
+                )
+            else:
+                ax.set_xlabel(f"Work chains (sorted by {self.sort_by.label})")
+            ax.set_ylabel("Energy relative to the ground state (eV)")
+            ax.legend(title="Multiplicity")
+            plt.show()
+
+
 class SearchCompletedWidget(ipw.VBox):
     pks = traitlets.List(allow_none=True)
 
-    def __init__(self, workchain_class, fields=None):
+    # html table header
+    COLUMN_NAMES = {
+        "pk": "PK",
+        "uuid": "UUID",
+        "ctime": "Creation Time",
+        "formula": "Formula",
+        "description": "Descrition",
+        "energy": "Energy (eV)",
+        "thumbnail": "Thumbnail",
+    }
+
+    # The partially rendered results table is displayed every RENDER_CHUNK_SIZE rows.
+    RENDER_CHUNK_SIZE = 10
+
+    # Rows of the recent searches, shared by all the widgets of the process. The
+    # entries are keyed on the search filters and on a marker that changes whenever
+    # a matching work chain is added or modified, see `_get_change_marker`.
+    _results_cache = LRUCache(maxsize=32)
+
+    def __init__(self, workchain_class, fields=None, page_size=25):
         # search UI
         self.workchain_class = workchain_class
         style = {"description_width": "150px"}
@@ -417,56 +1101,273 @@ class SearchCompletedWidget(ipw.VBox):
 
         search_button.on_click(on_click)
 
+        # Comparison of the energies of all the results of the search.
+        self.comparison = ComparisonWidget(show_groups=False)
+        compare_button = ipw.Button(
+            description="Compare results",
+            tooltip="Compare the energies of all the results (not only this page)",
+        )
+
+        def on_compare(_):
+            if self._query_filters is not None:
+                self.comparison.compare(filters=self._query_filters)
+
+        compare_button.on_click(on_compare)
+
+        # Export of all the results of the search, without the thumbnails.
+        self.export_format = ipw.Dropdown(
+            options=[(name, fmt) for fmt, name in EXPORT_FORMATS.items()],
+            layout={"width": "120px"},
+        )
+        export_button = ipw.Button(
+            description="Export results",
+            tooltip="Export all the results (not only this page) to a file",
+        )
+        export_button.on_click(self._export)
+        self.export_link = ipw.HTML()
+
+        # Pagination: only the rows of the current page are fetched and rendered.
+        self._query_filters = None
+        self._n_results = 0
+        self._page = 0
+        self._rows = []
+        self.page_size = ipw.Dropdown(
+            description="Results per page:",
+            options=sorted({10, 25, 50, 100, page_size}),
+            value=page_size,
+            style={"description_width": "initial"},
+            layout={"width": "200px"},
+        )
+        self.page_size.observe(lambda _: self._show_page(0), names="value")
+        self.previous_page_button = ipw.Button(description="Previous", disabled=True)
+        self.previous_page_button.on_click(lambda _: self._show_page(self._page - 1))
+        self.next_page_button = ipw.Button(description="Next", disabled=True)
+        self.next_page_button.on_click(lambda _: self._show_page(self._page + 1))
+        self.page_info = ipw.HTML()
+        pagination = ipw.HBox(
+            [
+                self.previous_page_button,
+                self.page_info,
+                self.next_page_button,
+                self.page_size,
+            ]
+        )
+
         app = ipw.VBox(
-            children=search_crit + [search_button, self.results, self.info_out]
+            children=search_crit
+            + [
+                ipw.HBox(
+                    [
+                        search_button,
+                        compare_button,
+                        export_button,
+                        self.export_format,
+                        self.export_link,
+                    ]
+                ),
+                pagination,
+                self.results,
+                self.info_out,
+                self.comparison,
+            ]
         )
 
         super().__init__([app])
 
+    @tracing.traced("search")
     def search(self):
+        # Index the work chains finished since the last search, so that they can
+        # be found by the filters on the search extras (e.g. the formula).
+        index_work_chains(incremental=True)
+
+        self._query_filters = self.prepare_query_filters()
+        self._show_page(0)
+
+    def _export(self, _=None):
+        """Export the results in a thread, and show a link to the file."""
+        if self._query_filters is None:
+            self.export_link.value = "No search was done yet."
+            return
+        filters = self._query_filters
+        fmt = self.export_format.value
+        # The exports are written to the user cache, not to the app's directory.
+        # The notebook server does not serve hidden directories such as the
+        # cache, so the file is downloaded as a data URL.
+        directory = get_cache_dir("exports")
+        directory.mkdir(parents=True, exist_ok=True)
+        path = (
+            directory / f"search_results_{datetime.datetime.now():%Y%m%d_%H%M%S}.{fmt}"
+        )
+
+        def _run():
+            self.export_link.value = "Exporting..."
+            try:
+                with tracing.span("export_results"):
+                    n_rows = export_work_chains(path, fmt, filters)
+                content = b64encode(path.read_bytes()).decode()
+            except Exception as error:
+                self.export_link.value = f"Export failed: {error}"
+                return
+            self.export_link.value = (
+                f'<a download="{path.name}" href="data:text/plain;base64,{content}"'
+                f' target="_blank">{path.name}</a> ({n_rows} work chains, saved'
+                f" in {directory})"
+            )
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    def _get_change_marker(self, filters):
+        """Return the number of matching work chains and their latest modification time."""
+        qb = orm.QueryBuilder()
+        qb.append(
+            self.workchain_class,
+            filters=filters,
+            project=[{"id": {"func": "count"}}, {"mtime": {"func": "max"}}],
+        )
+        return tuple(qb.one())
+
+    def _build_query(self, filters):
+        # A single query projecting only the needed columns of the work chain
+        # and of its `gs_structure` and `gs_energy` outputs.
+        qb = orm.QueryBuilder()
+        qb.append(
+            self.workchain_class,
+            filters=filters,
+            project=["id", "uuid", "ctime", "description"],
+            tag="work_chain",
+        )
+        qb.append(
+            orm.StructureData,
+            with_incoming="work_chain",
+            edge_filters={"label": "gs_structure"},
+            project=["attributes.kinds", "attributes.sites"],
+        )
+        qb.append(
+            orm.Float,
+            with_incoming="work_chain",
+            edge_filters={"label": "gs_energy"},
+            project=["attributes.value"],
+        )
+        qb.order_by({"work_chain": [{"ctime": "desc"}, {"id": "desc"}]})
+        return qb
+
+    def _show_page(self, page):
+        if self._query_filters is None:
+            return  # no search was done yet
+
         self.results.value = "searching..."
         self.value = "searching..."
 
-        # html table header
-        column_names = {
-            "pk": "PK",
-            "uuid": "UUID",
-            "ctime": "Creation Time",
-            "formula": "Formula",
-            "description": "Descrition",
-            "energy": "Energy (eV)",
-            "thumbnail": "Thumbnail",
-        }
-
-        # Query AiiDA database
-        qb = orm.QueryBuilder()
-        qb.append(self.workchain_class, filters=self.prepare_query_filters())
-        qb.order_by({self.workchain_class: {"ctime": "desc"}})
-        rows = []
-        for node in qb.all(flat=True):
-            if "thumbnail" not in node.extras:
-                ase_structure = node.outputs.gs_structure.get_ase()
-                ase_structure.cell = None
-                ase_structure.pbc = None
-                node.set_extra("thumbnail", render_thumbnail(ase_structure))
+        # Only count the matches here, the rows are fetched page by page.
+        change_marker = self._get_change_marker(self._query_filters)
+        self._n_results = change_marker[0]
+
+        page_size = self.page_size.value
+        n_pages = max(1, -(-self._n_results // page_size))
+        self._page = min(max(page, 0), n_pages - 1)
 
+        cache_key = (
+            json.dumps(self._query_filters, sort_keys=True, default=str),
+            change_marker,
+            self._page,
+            page_size,
+        )
+        missing_thumbnails = {}
+        self._rows = self._results_cache.get(cache_key)
+        if self._rows is None:
+            qb = self._build_query(self._query_filters)
+            qb.limit(page_size).offset(self._page * page_size)
+
+            # The rows are rendered while they are fetched, the missing thumbnails
+            # are filled in as soon as they are rendered.
+            self._rows = []
+            self._render_results(
+                self._iter_rows(qb, self._rows, missing_thumbnails),
+                chunk_size=self.RENDER_CHUNK_SIZE,
+            )
+            self._results_cache.put(cache_key, self._rows)
+        else:
+            self._render_results(self._rows)
+
+        self.page_info.value = f"&nbsp;Page {self._page + 1} of {n_pages}&nbsp;"
+        self.previous_page_button.disabled = self._page == 0
+        self.next_page_button.disabled = self._page >= n_pages - 1
+
+        if missing_thumbnails:
+            threading.Thread(
+                target=self._fill_thumbnails,
+                args=(self._rows, missing_thumbnails, cache_key),
+                daemon=True,
+            ).start()
+
+    @staticmethod
+    def _iter_rows(qb, rows, missing_thumbnails):
+        thumbnail_cache = get_thumbnail_cache()
+        for pk, uuid, ctime, description, kinds, sites, energy in qb.iterall():
+            atoms = get_ase_from_attributes(kinds, sites)
+            thumbnail_key = get_thumbnail_key(atoms)
+            thumbnail = thumbnail_cache.get(thumbnail_key)
             row = {
-                "pk": node.pk,
-                "uuid": node.uuid,
-                "ctime": node.ctime.strftime("%Y-%m-%d %H:%M"),
-                "formula": node.outputs.gs_structure.get_formula(),
-                "description": node.description,
-                "energy": node.outputs.gs_energy.value,
-                "thumbnail": node.extras["thumbnail"],
+                "pk": pk,
+                "uuid": uuid,
+                "ctime": ctime.strftime("%Y-%m-%d %H:%M"),
+                "formula": get_formula_from_attributes(kinds, sites),
+                "description": description,
+                "energy": energy,
+                "thumbnail": thumbnail,
             }
+            if thumbnail is None:
+                missing_thumbnails[submit_thumbnail(atoms)] = (thumbnail_key, row)
 
             rows.append(row)
+            yield row
 
-        template = jinja2.Template(
-            importlib.resources.read_text("empa_molecules.templates", "search.j2")
-        )
-        self.results.value = template.render(column_names=column_names, rows=rows)
-
+    def _fill_thumbnails(self, rows, missing_thumbnails, cache_key):
+        for future in as_completed(missing_thumbnails):
+            thumbnail_key, row = missing_thumbnails[future]
+            try:
+                thumbnail = future.result()
+            except Exception:
+                # Show that there is no thumbnail, and do not serve the rows from
+                # the cache anymore, so that the thumbnail is rendered again the
+                # next time the page is shown.
+                row["thumbnail"] = ""
+                self._results_cache.pop(cache_key)
+            else:
+                row["thumbnail"] = thumbnail
+                get_thumbnail_cache().put(thumbnail_key, thumbnail)
+
+            # The user might have moved to another page in the meantime.
+            if rows is self._rows:
+                self._render_results(rows)
+
+    def _render_results(self, rows, chunk_size=None):
+        """Render the results table.
+
+        If `chunk_size` is given, the partially rendered table is displayed every
+        `chunk_size` rows, so that the first rows show up while the others are
+        still being fetched.
+        """
+        html = []
+
+        def _rows():
+            for i, row in enumerate(rows):
+                if chunk_size and i and i % chunk_size == 0:
+                    self.results.value = "".join(html)
+                yield row
+
+        first = self._page * self.page_size.value + 1
+        for chunk in get_template("search.j2").generate(
+            column_names=self.COLUMN_NAMES,
+            rows=_rows(),
+            total=self._n_results,
+            first=first,
+            last=min(first + self.page_size.value - 1, self._n_results),
+        ):
+            html.append(chunk)
+        self.results.value = "".join(html)
+
+    @tracing.traced("prepare_query_filters")
     def prepare_query_filters(self):
         filters = {}
 
@@ -493,3 +1394,45 @@ class SearchCompletedWidget(ipw.VBox):
         filters["ctime"] = {"and": [{"<=": end_date}, {">": start_date}]}
 
         return filters
+
+
+class TimingsPanel(ipw.VBox):
+    """Debug panel showing the timings of the main entry points, see `tracing`."""
+
+    def __init__(self, **kwargs):
+        self.enabled = ipw.Checkbox(
+            description="Record timings", value=tracing.is_enabled(), indent=False
+        )
+        self.enabled.observe(self._toggle, names="value")
+        refresh_button = ipw.Button(description="Refresh", icon="refresh")
+        refresh_button.on_click(self.refresh)
+        reset_button = ipw.Button(description="Reset")
+        reset_button.on_click(self._reset)
+        self.table = ipw.HTML()
+        self.export_link = ipw.HTML()
+
+        super().__init__(
+            children=[
+                ipw.HBox(
+                    [self.enabled, refresh_button, reset_button, self.export_link]
+                ),
+                self.table,
+            ],
+            **kwargs,
+        )
+        self.refresh()
+
+    def _toggle(self, change):
+        tracing.set_enabled(change["new"])
+
+    def _reset(self, _=None):
+        tracing.reset()
+        self.refresh()
+
+    def refresh(self, _=None):
+        self.table.value = get_template("timings.j2").render(stats=tracing.get_stats())
+        content = b64encode(tracing.export_json().encode()).decode()
+        self.export_link.value = (
+            f'<a download="timings.json" href="data:application/json;base64,{content}"'
+            ' target="_blank">Export JSON</a>'
+        )
@@ -0,0 +1,64 @@
+import pytest
+from aiida.common.links import LinkType
+
+pytest_plugins = ["aiida.tools.pytest_fixtures"]
+
+
+@pytest.fixture
+def generate_process():
+    """Return a function that stores a running process, called by `caller` if given."""
+    from aiida import orm
+
+    def _generate_process(caller=None, label="Process"):
+        process = orm.WorkflowNode()
+        process.set_process_label(label)
+        process.set_process_state("running")
+        if caller is not None:
+            process.base.links.add_incoming(caller, LinkType.CALL_WORK, label.lower())
+        return process.store()
+
+    return _generate_process
+
+
+@pytest.fixture
+def generate_spin_work_chain():
+    """Return a function that stores a finished GaussianSpinWorkChain with outputs.
+
+    `opt_energies` are the optimized energies (eV) by multiplicity, the lowest
+    one being the ground state.
+    """
+    import ase.build
+    from aiida import orm
+
+    def _generate_spin_work_chain(
+        molecule="H2O", opt_energies=None, functional="B3LYP", exit_status=0
+    ):
+        opt_energies = opt_energies or {1: -100.0, 3: -99.0}
+        structure = orm.StructureData(ase=ase.build.molecule(molecule)).store()
+        inputs = {
+            "structure": structure,
+            "functional": orm.Str(functional).store(),
+            "basis_set_opt": orm.Str("STO-3G").store(),
+            "multiplicity_list": orm.List(list(opt_energies)).store(),
+        }
+        work_chain = orm.WorkChainNode()
+        work_chain.set_process_label("GaussianSpinWorkChain")
+        work_chain.set_process_state("finished")
+        work_chain.set_exit_status(exit_status)
+        for label, node in inputs.items():
+            work_chain.base.links.add_incoming(node, LinkType.INPUT_WORK, label)
+        work_chain.store()
+
+        gs_multiplicity = min(opt_energies, key=opt_energies.get)
+        outputs = {
+            "gs_structure": orm.StructureData(ase=ase.build.molecule(molecule)),
+            "gs_energy": orm.Float(opt_energies[gs_multiplicity]),
+            "gs_multiplicity": orm.Int(gs_multiplicity),
+        }
+        for multiplicity, energy in opt_energies.items():
+            outputs[f"m{multiplicity}_opt_energy"] = orm.Float(energy)
+        for label, node in outputs.items():
+            node.store().base.links.add_incoming(work_chain, LinkType.RETURN, label)
+        return work_chain
+
+    return _generate_spin_work_chain
@@ -0,0 +1,50 @@
+import asyncio
+
+import ase.build
+import pytest
+from aiida import orm
+
+from empa_molecules import campaign
+
+
+@pytest.mark.usefixtures("aiida_profile_clean")
+def test_campaign_yields_between_submissions(generate_process, monkeypatch):
+    events = []
+
+    def submit(builder):
+        events.append("submit")
+        return generate_process()
+
+    monkeypatch.setattr(campaign.engine, "submit", submit)
+    monkeypatch.setattr(campaign, "count_active_work_chains", lambda computer: 0)
+
+    async def other_task():
+        while True:
+            events.append("other")
+            await asyncio.sleep(0)
+
+    async def run():
+        task = asyncio.ensure_future(other_task())
+        await campaign_.run()
+        task.cancel()
+
+    structures = [ase.build.molecule(name) for name in ["H2O", "CH4", "NH3"]]
+    campaign_ = campaign.Campaign(
+        structures,
+        get_builder=lambda structure: None,
+        group_label="campaign",
+        computer=None,
+        max_active=10,
+    )
+    asyncio.run(run())
+
+    assert campaign_.n_submitted == 3
+    nodes = orm.load_group("campaign").nodes
+    assert sorted(node.base.extras.get("formula") for node in nodes) == [
+        "CH4",
+        "H2O",
+        "H3N",
+    ]
+    # The other task runs between the submissions.
+    submissions = [i for i, event in enumerate(events) if event == "submit"]
+    assert all(events[i + 1] == "other" for i in submissions[:-1])
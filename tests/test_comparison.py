@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from aiida import orm
+
+from empa_molecules.comparison import Comparison, get_comparison_rows
+from empa_molecules.widgets import ComparisonWidget
+
+
+def test_comparison_empty():
+    comparison = Comparison([])
+    assert len(comparison) == 0
+    assert comparison.multiplicities.tolist() == []
+    assert comparison.gs_energy.tolist() == []
+    assert comparison.get_order("gs_energy").tolist() == []
+    assert list(comparison.get_columns()) == list(Comparison.COLUMNS)
+
+
+def test_comparison_nan_energies():
+    rows = [
+        (1, "uuid1", "H2O", "B3LYP", "STO-3G", -100.0, "m1_opt_energy"),
+        (1, "uuid1", "H2O", "B3LYP", "STO-3G", -98.5, "m3_opt_energy"),
+        (1, "uuid1", "H2O", "B3LYP", "STO-3G", -99.0, "m3_vert_energy"),
+        (1, "uuid1", "H2O", "B3LYP", "STO-3G", 7.0, "gs_ionization_potential"),
+        # The ground state is the triplet, the singlet is missing.
+        (2, "uuid2", None, "PBE", "STO-3G", -51.0, "m3_opt_energy"),
+        # No optimized energy: no ground state.
+        (3, "uuid3", "CH4", "PBE", "STO-3G", -40.0, "m1_vert_energy"),
+    ]
+    comparison = Comparison(rows)
+
+    assert comparison.pks.tolist() == [1, 2, 3]
+    assert comparison.formulas.tolist() == ["H2O", "", "CH4"]
+    assert comparison.multiplicities.tolist() == [1, 3]
+    np.testing.assert_equal(comparison.gs_multiplicity, [1, 3, np.nan])
+    np.testing.assert_equal(comparison.gs_energy, [-100.0, -51.0, np.nan])
+    np.testing.assert_allclose(comparison.spin_gap, [1.5, np.nan, np.nan])
+    np.testing.assert_allclose(
+        comparison.relative_opt_energies, [[0.0, 1.5], [np.nan, 0.0], [np.nan, np.nan]]
+    )
+    np.testing.assert_allclose(
+        comparison.relative_vert_energies,
+        [[np.nan, 1.0], [np.nan, np.nan], [np.nan, np.nan]],
+    )
+    np.testing.assert_equal(comparison.ionization_potential, [7.0, np.nan, np.nan])
+    np.testing.assert_equal(comparison.electron_affinity, [np.nan] * 3)
+
+    # The missing values are sorted last.
+    assert comparison.get_order("spin_gap").tolist() == [0, 1, 2]
+    assert comparison.get_order("gs_energy", descending=True).tolist() == [1, 0, 2]
+    assert comparison.get_order("formula").tolist() == [1, 2, 0]
+
+
+@pytest.mark.usefixtures("aiida_profile_clean")
+def test_get_comparison_rows(generate_spin_work_chain):
+    work_chains = [
+        generate_spin_work_chain("H2O", {1: -100.0, 3: -98.5}),
+        generate_spin_work_chain("CH4", {1: -50.0}, functional="PBE"),
+    ]
+    group = orm.Group("selection").store()
+    group.add_nodes(work_chains[1])
+
+    rows = get_comparison_rows()
+    assert sorted(row[0] for row in rows) == [work_chains[0].pk] * 2 + [
+        work_chains[1].pk
+    ]
+    comparison = Comparison(rows)
+    assert comparison.pks.tolist() == [work_chain.pk for work_chain in work_chains]
+    assert comparison.functionals.tolist() == ["B3LYP", "PBE"]
+    np.testing.assert_allclose(comparison.spin_gap, [1.5, np.nan])
+
+    comparison = Comparison.from_database(group_label="selection")
+    assert comparison.pks.tolist() == [work_chains[1].pk]
+    assert comparison.multiplicities.tolist() == [1]
+    assert len(Comparison.from_database(group_label="other")) == 0
+
+    filters = {"id": work_chains[0].pk}
+    assert len(Comparison.from_database(filters, group_label="selection")) == 0
+
+
+@pytest.mark.usefixtures("aiida_profile_clean")
+def test_comparison_widget_groups():
+    widget = ComparisonWidget()
+    assert widget.group.value is None
+    assert widget.compare_group_button.disabled
+
+    orm.Group("selection").store()
+    widget.refresh_groups()
+    assert widget.group.value == "selection"
+    assert not widget.compare_group_button.disabled
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from aiida import orm
+from aiida_nanotech_empa.utils import stm_tools
+
+from empa_molecules import cube_planes
+
+HEIGHTS = [2.0, 3.0]
+
+
+@pytest.fixture
+def cube_planes_node():
+    """Return an ArrayData with the planes of two orbitals (one with both spins)."""
+    rng = np.random.default_rng(0)
+    node = orm.ArrayData()
+    node.set_array("x_arr", np.linspace(0, 10, 24))
+    node.set_array("y_arr", np.linspace(0, 8, 20))
+    node.set_array("h_arr", np.array(HEIGHTS))
+    for name in ["cube_1", "cube_2", "cube_2_b"]:
+        node.set_array(name, rng.normal(size=(24, 20, len(HEIGHTS))))
+    return node.store()
+
+
+@pytest.fixture
+def sop():
+    return {"moenergies": [[-6.0, -4.0], [-5.5, -3.5]], "homos": [0, 0]}
+
+
+def test_extrapolate_planes():
+    rng = np.random.default_rng(0)
+    planes = rng.normal(size=(3, 24, 20))
+    energies = [-6.0, -4.5, 0.5]  # the last state is unbound
+    delta_hs = [0.0, 1.0, 2.5]
+
+    maps = cube_planes.extrapolate_planes(planes, energies, 0.4, 0.3, delta_hs)
+
+    assert maps.shape == (3, 3, 24, 20)
+    assert maps.dtype == np.float32
+    for i_orb, (plane, energy) in enumerate(zip(planes, energies)):
+        for i_h, delta_h in enumerate(delta_hs):
+            expected = stm_tools.extrapolate_morb(plane, 0.4, 0.3, energy, delta_h)
+            np.testing.assert_allclose(maps[i_orb, i_h], expected, rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.usefixtures("aiida_profile")
+def test_spm_maps(cube_planes_node, sop):
+    cpa_dict = cube_planes.process_cube_planes(cube_planes_node)
+    maps = cube_planes.SpmMaps(cpa_dict, sop, extrap_h=3.0, heights=[3.0, 4.0, 5.0])
+
+    assert maps.orbitals == [(0, 0), (1, 0), (1, 1)]
+    assert maps.maps.shape == (3, 3, 24, 20)
+    np.testing.assert_allclose(
+        maps.get_map(1, 1, h=3.0), cpa_dict["mo_planes"][1][1][:, :, 1], atol=1e-5
+    )
+    assert maps.get_map(0, 0, h=4.2, kind="sts").shape == (24, 20)
+
+    with pytest.raises(ValueError):
+        cube_planes.SpmMaps(cpa_dict, sop, extrap_h=2.5, heights=[3.0])
+
+
+@pytest.mark.usefixtures("aiida_profile")
+def test_get_spm_maps_cache_size(cube_planes_node, sop, monkeypatch):
+    # The cache only fits the maps of four heights.
+    height_nbytes = 3 * 24 * 20 * 4
+    monkeypatch.setattr(cube_planes, "MAPS_CACHE_SIZE", 4 * height_nbytes)
+    monkeypatch.setattr(
+        cube_planes,
+        "_maps_cache",
+        cube_planes.LRUCache(4 * height_nbytes, getsize=lambda maps: maps.nbytes),
+    )
+
+    heights = np.arange(3.0, 6.51, 0.5)  # 8 heights
+    maps = cube_planes.get_spm_maps(cube_planes_node, sop, 3.0, heights)
+
+    np.testing.assert_allclose(maps.heights, [3.0, 4.0, 5.0, 6.0])
+    assert maps.nbytes == 4 * height_nbytes
+    assert cube_planes.get_spm_maps(cube_planes_node, sop, 3.0, heights) is maps
@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+
+import pytest
+
+from empa_molecules import export
+
+
+@pytest.fixture
+def work_chains(generate_spin_work_chain):
+    return [
+        generate_spin_work_chain("H2O", {1: -100.0, 3: -98.5}),
+        generate_spin_work_chain("CH4", {1: -50.0}, functional="PBE"),
+        generate_spin_work_chain("C6H6", {3: -200.0, 5: -199.0}),
+    ]
+
+
+@pytest.mark.usefixtures("aiida_profile_clean")
+def test_export_csv(work_chains, tmp_path):
+    path = tmp_path / "export.csv"
+    assert export.export_work_chains(path, "csv", batch_size=2) == 3
+
+    with open(path, newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert list(rows[0]) == export.COLUMNS + ["m1_energy", "m3_energy", "m5_energy"]
+    assert [row["pk"] for row in rows] == [str(wc.pk) for wc in work_chains]
+    assert [row["functional"] for row in rows] == ["B3LYP", "PBE", "B3LYP"]
+    assert [row["basis_set"] for row in rows] == ["STO-3G"] * 3
+    assert rows[0]["uuid"] == work_chains[0].uuid
+    assert [row["m1_energy"] for row in rows] == ["-100.0", "-50.0", ""]
+    assert [row["m3_energy"] for row in rows] == ["-98.5", "", "-200.0"]
+
+
+@pytest.mark.usefixtures("aiida_profile_clean")
+def test_export_jsonl(work_chains, tmp_path):
+    filters = {"id": {"in": [wc.pk for wc in work_chains[1:]]}}
+    path = tmp_path / "export.jsonl"
+    assert export.export_work_chains(path, "jsonl", filters, batch_size=1) == 2
+
+    with open(path) as file:
+        rows = [json.loads(line) for line in file]
+    assert rows == [
+        {
+            "pk": wc.pk,
+            "uuid": wc.uuid,
+            "formula": None,
+            "functional": functional,
+            "basis_set": "STO-3G",
+            "energies": energies,
+        }
+        for wc, functional, energies in zip(
+            work_chains[1:],
+            ["PBE", "B3LYP"],
+            [{"1": -50.0}, {"3": -200.0, "5": -199.0}],
+        )
+    ]
+
+
+def test_write_csv_new_multiplicity():
+    """The energies of multiplicities that appeared during the export are left out."""
+    rows = [
+        {"pk": 1, "energies": {1: -1.0}},
+        {"pk": 2, "energies": {1: -2.0, 3: -3.0}},
+    ]
+    file = io.StringIO()
+    assert export.write_csv(rows, file, [1]) == 2
+
+    file.seek(0)
+    assert [(row["pk"], row["m1_energy"]) for row in csv.DictReader(file)] == [
+        ("1", "-1.0"),
+        ("2", "-2.0"),
+    ]
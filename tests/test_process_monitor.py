@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+
+from empa_molecules.process_monitor import (
+    LocalProcessBroadcaster,
+    ProcessStateMonitor,
+    get_process_tree_pks,
+)
+
+
+class FailingBroadcaster:
+    """Broadcaster that cannot subscribe, so that the monitor polls the database."""
+
+    def subscribe(self, callback):
+        raise RuntimeError("no broker")
+
+
+class CallCounter:
+    def __init__(self):
+        self.count = 0
+        self.called = threading.Event()
+
+    def __call__(self):
+        self.count += 1
+        self.called.set()
+
+    def wait(self, timeout=5):
+        called = self.called.wait(timeout)
+        self.called.clear()
+        return called
+
+
+@pytest.mark.usefixtures("aiida_profile_clean")
+def test_get_process_tree_pks(generate_process):
+    root = generate_process()
+    child = generate_process(caller=root, label="Child")
+    grandchild = generate_process(caller=child, label="Grandchild")
+    other = generate_process(label="Other")
+
+    assert get_process_tree_pks(root.pk) == {root.pk, child.pk, grandchild.pk}
+    assert get_process_tree_pks(child.pk) == {child.pk, grandchild.pk}
+    assert get_process_tree_pks(other.pk) == {other.pk}
+
+
+@pytest.mark.usefixtures("aiida_profile_clean")
+def test_monitor_broadcast(generate_process):
+    root = generate_process()
+    child = generate_process(caller=root, label="Child")
+    other = generate_process(label="Other")
+    broadcaster = LocalProcessBroadcaster()
+    callback = CallCounter()
+    monitor = ProcessStateMonitor(
+        callbacks=[callback], broadcaster=broadcaster, max_interval=60
+    )
+
+    monitor.value = root.uuid
+    assert callback.wait()  # initial update
+    while not broadcaster._subscribers:
+        threading.Event().wait(0.01)
+
+    broadcaster.broadcast(other.pk)
+    assert not callback.wait(timeout=0.5)
+
+    broadcaster.broadcast(child.pk)
+    assert callback.wait()
+    assert callback.count == 2
+
+    monitor.value = None
+    assert not broadcaster._subscribers
+
+
+@pytest.mark.usefixtures("aiida_profile_clean")
+def test_monitor_poll(generate_process):
+    root = generate_process()
+    child = generate_process(caller=root, label="Child")
+    callback = CallCounter()
+    on_sealed = CallCounter()
+    monitor = ProcessStateMonitor(
+        callbacks=[callback],
+        on_sealed=[on_sealed],
+        broadcaster=FailingBroadcaster(),
+        min_interval=0.05,
+    )
+
+    monitor.value = root.uuid
+    assert callback.wait()  # initial update
+
+    # Polls with an unchanged modification time do not run the callbacks.
+    assert not callback.wait(timeout=0.5)
+    assert callback.count == 1
+
+    child.set_process_state("finished")
+    assert callback.wait()
+    assert callback.count == 2
+
+    root.seal()
+    monitor.join()
+    assert callback.count >= 3  # final update
+    assert on_sealed.count == 1
+
+
+def test_monitor_poll_interval():
+    monitor = ProcessStateMonitor(min_interval=0.5, max_interval=30, fast_period=60)
+
+    assert monitor.get_poll_interval(0) == 0.5
+    assert monitor.get_poll_interval(60) == 0.5
+    assert monitor.get_poll_interval(100) == 10
+    assert monitor.get_poll_interval(200) == 20
+    assert monitor.get_poll_interval(3600) == 30
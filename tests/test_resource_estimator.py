@@ -0,0 +1,185 @@
+import numpy as np
+import pytest
+from aiida import orm
+from aiida.common.links import LinkType
+
+from empa_molecules import resource_estimator
+from empa_molecules.resource_estimator import (
+    MIN_SAMPLES,
+    TARGET_WALL_TIME,
+    LogLinearModel,
+    ResourceEstimator,
+)
+
+
+def get_wall_time(sample):
+    """Synthetic wall time (s): ~ n_atoms^2 / n_mpi_tasks, twice as long with PBE0."""
+    factor = 2.0 if sample["functional"] == "pbe0" else 1.0
+    return 10 * factor * sample["n_atoms"] ** 2 / sample["n_mpi_tasks"]
+
+
+def generate_samples(n_samples, memory=True, noise=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    samples = []
+    for i in range(n_samples):
+        n_atoms = int(rng.integers(5, 200))
+        sample = {
+            "n_atoms": n_atoms,
+            "n_electrons": int(n_atoms * rng.uniform(3, 6)),
+            "multiplicity": int(rng.choice([1, 3])),
+            "functional": ["b3lyp", "b3lyp", "pbe0"][i % 3],
+            "basis_set": "sto-3g",
+            "n_mpi_tasks": int(rng.choice([1, 4, 16])),
+        }
+        sample["wall_time"] = get_wall_time(sample) * np.exp(rng.normal(0, noise))
+        sample["memory_kb"] = 1000.0 * n_atoms if memory else None
+        samples.append(sample)
+    return samples
+
+
+def test_log_linear_model():
+    samples = generate_samples(50)
+    model = LogLinearModel(
+        samples, "wall_time", ["n_atoms", "n_mpi_tasks"], ["functional"]
+    )
+
+    assert model.n_samples == 50
+    assert model.categorical == {"functional": ["b3lyp", "pbe0"]}
+    assert model.coefficients == pytest.approx([np.log(10), 2, -1, np.log(2)], abs=0.01)
+    test_sample = {"n_atoms": 100, "n_mpi_tasks": 4, "functional": "pbe0"}
+    estimate, low, high = model.predict(test_sample)
+    assert estimate == pytest.approx(get_wall_time(test_sample), rel=0.02)
+    assert low <= estimate <= high
+
+    # An unknown functional is treated as the most common one.
+    test_sample["functional"] = "unknown"
+    estimate, _, _ = model.predict(test_sample)
+    assert estimate == pytest.approx(get_wall_time(test_sample), rel=0.02)
+
+
+def test_log_linear_model_band():
+    samples = generate_samples(500, noise=0.2)
+    model = LogLinearModel(
+        samples, "wall_time", ["n_atoms", "n_mpi_tasks"], ["functional"]
+    )
+
+    assert model.sigma == pytest.approx(0.2, rel=0.2)
+    inside = [
+        model.predict(sample)[1] <= sample["wall_time"] <= model.predict(sample)[2]
+        for sample in samples
+    ]
+    assert np.mean(inside) == pytest.approx(0.9, abs=0.05)
+
+
+def test_log_linear_model_without_samples():
+    with pytest.raises(ValueError):
+        LogLinearModel(generate_samples(10, memory=False), "memory_kb", [], [])
+
+
+def test_resource_estimator():
+    estimator = ResourceEstimator(generate_samples(MIN_SAMPLES * 3))
+    features = {
+        "n_atoms": 100,
+        "n_electrons": 400,
+        "multiplicity": 1,
+        "functional": "b3lyp",
+        "basis_set": "sto-3g",
+        "n_mpi_tasks": 1,
+    }
+
+    estimates = estimator.estimate(features)
+    assert estimates["memory_kb"][0] == pytest.approx(100000, rel=0.05)
+    n_mpi_tasks = estimator.recommend_mpi_tasks(features)
+    assert n_mpi_tasks in estimator.mpi_tasks_choices
+    high = estimator.estimate(dict(features, n_mpi_tasks=n_mpi_tasks))["wall_time"][2]
+    assert high <= TARGET_WALL_TIME or n_mpi_tasks == estimator.mpi_tasks_choices[-1]
+
+
+def test_resource_estimator_without_memory():
+    # No calculation reported its memory: only the wall time is estimated.
+    samples = generate_samples(MIN_SAMPLES, memory=False)
+    samples[0]["memory_kb"] = 1000.0
+    estimator = ResourceEstimator(samples)
+
+    assert estimator.memory_model is None
+    estimates = estimator.estimate(samples[1])
+    assert estimates["memory_kb"] is None
+    assert estimates["wall_time"] is not None
+
+
+@pytest.fixture
+def add_gaussian_calculation():
+    """Return a function that adds a finished Gaussian calculation to a work chain."""
+
+    def _add_gaussian_calculation(work_chain, wall_time, n_mpi_tasks, memory_kb):
+        calculation = orm.CalcJobNode()
+        calculation.set_process_label("GaussianCalculation")
+        calculation.set_process_state("finished")
+        calculation.set_exit_status(0)
+        calculation.base.attributes.set(
+            "resources", {"num_machines": 1, "tot_num_mpiprocs": n_mpi_tasks}
+        )
+        calculation.base.attributes.set("max_memory_kb", memory_kb)
+        calculation.base.links.add_incoming(work_chain, LinkType.CALL_CALC, "gaussian")
+        calculation.store()
+        output_parameters = orm.Dict({"metadata": {"wall_time": [wall_time]}})
+        output_parameters.base.links.add_incoming(
+            calculation, LinkType.CREATE, "output_parameters"
+        )
+        output_parameters.store()
+        return calculation
+
+    return _add_gaussian_calculation
+
+
+@pytest.fixture
+def reset_estimator(monkeypatch):
+    monkeypatch.setattr(resource_estimator, "_estimator", None)
+    monkeypatch.setattr(resource_estimator, "_estimator_n_samples", None)
+
+
+@pytest.mark.usefixtures("aiida_profile_clean", "reset_estimator")
+def test_empty_profile(generate_spin_work_chain):
+    assert resource_estimator.get_training_data() == []
+    assert resource_estimator.get_estimator() is None
+
+    # Finished work chains without any Gaussian calculation.
+    for _ in range(MIN_SAMPLES):
+        generate_spin_work_chain()
+    assert resource_estimator.get_training_data() == []
+    assert resource_estimator.get_estimator() is None
+
+
+@pytest.mark.usefixtures("aiida_profile_clean", "reset_estimator")
+def test_get_training_data(generate_spin_work_chain, add_gaussian_calculation):
+    work_chain = generate_spin_work_chain("C6H6", {1: -100.0, 3: -99.0})
+    add_gaussian_calculation(work_chain, 100.0, 4, 2000)
+    add_gaussian_calculation(work_chain, 300.0, 4, 1000)
+    generate_spin_work_chain("CH4")  # without Gaussian calculation
+    failed = generate_spin_work_chain("H2O", exit_status=300)
+    add_gaussian_calculation(failed, 100.0, 4, 1000)
+
+    assert resource_estimator.get_training_data() == [
+        {
+            "wall_time": 300.0,
+            "memory_kb": 2000,
+            "n_mpi_tasks": 4,
+            "n_atoms": 12,
+            "n_electrons": 42,
+            "multiplicity": 3,
+            "functional": "b3lyp",
+            "basis_set": "sto-3g",
+        }
+    ]
+
+
+@pytest.mark.usefixtures("aiida_profile_clean", "reset_estimator")
+def test_get_estimator(generate_spin_work_chain, add_gaussian_calculation):
+    for i in range(MIN_SAMPLES):
+        work_chain = generate_spin_work_chain(["H2O", "CH4", "C6H6"][i % 3])
+        add_gaussian_calculation(work_chain, 100.0 * (i + 1), 1 + i % 2, 1000 * (i + 1))
+
+    estimator = resource_estimator.get_estimator()
+    assert estimator.n_samples == MIN_SAMPLES
+    assert estimator.memory_model is not None
+    assert resource_estimator.get_estimator() is estimator  # not fitted again
@@ -0,0 +1,83 @@
+import ase.build
+import pytest
+from aiida import orm
+
+from empa_molecules import search_index
+from empa_molecules.utils import get_formula_from_attributes
+
+
+def get_formulas(structure, mode):
+    attributes = structure.base.attributes
+    return (
+        get_formula_from_attributes(
+            attributes.get("kinds"), attributes.get("sites"), mode=mode
+        ),
+        structure.get_formula(mode=mode),
+    )
+
+
+@pytest.mark.usefixtures("aiida_profile")
+@pytest.mark.parametrize("mode", ["hill", "hill_compact", "reduce", "group", "count"])
+@pytest.mark.parametrize("molecule", ["H2O", "C6H6", "CH3CH2OH", "C60"])
+def test_get_formula_from_attributes(molecule, mode):
+    structure = orm.StructureData(ase=ase.build.molecule(molecule))
+    formula, expected = get_formulas(structure, mode)
+    assert formula == expected
+
+
+@pytest.mark.usefixtures("aiida_profile")
+@pytest.mark.parametrize("mode", ["hill", "reduce"])
+def test_get_formula_from_attributes_alloy(mode):
+    structure = orm.StructureData(cell=[[10, 0, 0], [0, 10, 0], [0, 0, 10]])
+    structure.append_atom(position=(0, 0, 0), symbols=["Fe", "Ni"], weights=[0.4, 0.6])
+    structure.append_atom(position=(2, 0, 0), symbols="O")
+    structure.append_atom(position=(4, 0, 0), symbols="O")
+    formula, expected = get_formulas(structure, mode)
+    assert formula == expected
+
+
+@pytest.mark.usefixtures("aiida_profile_clean")
+def test_index_work_chains(generate_spin_work_chain):
+    work_chains = [
+        generate_spin_work_chain("H2O", {1: -100.0, 3: -98.5}),
+        generate_spin_work_chain("CH4", {1: -50.0}),
+        generate_spin_work_chain("C6H6", {1: -200.0, 3: -201.0}),
+    ]
+    failed = generate_spin_work_chain("H2O", exit_status=300)
+
+    assert search_index.index_work_chains(batch_size=2) == 3
+    extras = work_chains[0].base.extras
+    assert extras.get("formula") == "H2O"
+    assert extras.get("elements") == ["H", "O"]
+    assert extras.get("n_atoms") == 3
+    assert extras.get("gs_energy") == -100.0
+    assert extras.get("gs_multiplicity") == 1
+    assert extras.get("spin_gap") == pytest.approx(1.5)
+    assert extras.get(search_index.INDEX_VERSION_KEY) == search_index.INDEX_VERSION
+    assert "spin_gap" not in work_chains[1].base.extras.keys()
+    assert work_chains[2].base.extras.get("gs_multiplicity") == 3
+    assert search_index.INDEX_VERSION_KEY not in failed.base.extras.keys()
+
+    # Only the work chains that are not indexed, or by an older version, are indexed.
+    assert search_index.index_work_chains() == 0
+    work_chains[1].base.extras.set(
+        search_index.INDEX_VERSION_KEY, search_index.INDEX_VERSION - 1
+    )
+    new = generate_spin_work_chain("CH4")
+    assert search_index.index_work_chains() == 2
+    assert new.base.extras.get("formula") == "CH4"
+    assert search_index.index_work_chains(incremental=False) == 4
+
+
+@pytest.mark.usefixtures("aiida_profile_clean")
+def test_find_finished_calculation(generate_spin_work_chain):
+    work_chain = generate_spin_work_chain("H2O", functional="B3LYP")
+    generate_spin_work_chain("H2O", functional="PBE")
+    search_index.index_work_chains()
+
+    inputs = {
+        link.link_label: link.node
+        for link in work_chain.base.links.get_incoming().all()
+    }
+    calculation_hash = search_index.get_inputs_calculation_hash(inputs)
+    assert search_index.find_finished_calculation(calculation_hash) == work_chain
@@ -0,0 +1,51 @@
+from base64 import b64encode
+
+import pytest
+from aiida import orm
+from aiida.common.links import LinkType
+
+from empa_molecules.thumbnails import (
+    ThumbnailCache,
+    get_thumbnail_key,
+    migrate_thumbnail_extras,
+)
+
+THUMBNAIL = b64encode(b"png" * 100).decode()
+
+
+def test_thumbnail_cache_size(tmp_path):
+    cache = ThumbnailCache(tmp_path, max_size=1000)
+
+    cache.put("a", THUMBNAIL)
+    cache.put("a", THUMBNAIL)  # replaces the file
+    assert cache._size == 300
+    assert cache.get("a") == THUMBNAIL
+
+    cache.put("b", THUMBNAIL)
+    cache.put("c", THUMBNAIL)
+    cache.put("d", THUMBNAIL)  # evicts the oldest file
+    assert cache._size == 900
+    assert cache.get("a") is None
+
+
+@pytest.mark.usefixtures("aiida_profile_clean")
+def test_migrate_thumbnail_extras(tmp_path):
+    structure = orm.StructureData(cell=[[10, 0, 0], [0, 10, 0], [0, 0, 10]])
+    structure.append_atom(position=(0, 0, 0), symbols="H")
+    structure.append_atom(position=(0, 0, 0.74), symbols="H")
+    structure.store()
+    work_chain = orm.WorkChainNode().store()
+    structure.base.links.add_incoming(work_chain, LinkType.RETURN, "gs_structure")
+    work_chain.base.extras.set("thumbnail", THUMBNAIL)
+    # Extras on nodes without a ground state structure are removed too.
+    others = [orm.WorkChainNode().store() for _ in range(3)]
+    for node in others:
+        node.base.extras.set("thumbnail", THUMBNAIL)
+
+    cache = ThumbnailCache(tmp_path)
+    assert migrate_thumbnail_extras(cache, batch_size=2) == 4
+
+    assert cache.get(get_thumbnail_key(structure.get_ase())) == THUMBNAIL
+    for node in [work_chain] + others:
+        assert "thumbnail" not in node.base.extras.keys()
+    assert migrate_thumbnail_extras(cache) == 0
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from empa_molecules import tracing
+
+
+@pytest.fixture
+def enable_tracing(monkeypatch):
+    """Enable the tracing with no recorded spans, and restore it afterwards."""
+    monkeypatch.setattr(tracing, "_enabled", True)
+    monkeypatch.setattr(tracing, "_spans", {})
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(tracing, "_enabled", False)
+    monkeypatch.setattr(tracing, "_spans", {})
+
+    @tracing.traced("func")
+    def func():
+        return 1
+
+    with tracing.span("block"):
+        assert func() == 1
+    assert tracing.get_stats() == {}
+
+
+def test_span(enable_tracing):
+    with tracing.span("block"):
+        pass
+    with pytest.raises(RuntimeError):
+        with tracing.span("block"):
+            raise RuntimeError
+
+    stats = tracing.get_stats()
+    assert list(stats) == ["block"]
+    assert stats["block"]["count"] == 2
+
+
+def test_traced(enable_tracing):
+    @tracing.traced("func")
+    def func(a, b=0):
+        """Docstring."""
+        return a + b
+
+    assert func(1, b=2) == 3
+    assert func.__name__ == "func"
+    assert func.__doc__ == "Docstring."
+    assert tracing.get_stats()["func"]["count"] == 1
+
+
+def test_traced_generator(enable_tracing):
+    @tracing.traced("gen")
+    def gen(n):
+        yield from range(n)
+        return "done"
+
+    iterator = gen(3)
+    assert next(iterator) == 0
+    # The span lasts until the generator is exhausted.
+    assert tracing.get_stats() == {}
+    assert list(iterator) == [1, 2]
+    assert tracing.get_stats()["gen"]["count"] == 1
+
+    def consume():
+        return (yield from gen(1))
+
+    assert list(consume()) == [0]
+    assert tracing.get_stats()["gen"]["count"] == 2
+
+
+def test_get_stats(enable_tracing):
+    for duration in range(1, 101):
+        tracing.record("span", duration / 100)
+
+    stats = tracing.get_stats()["span"]
+    assert stats["count"] == 100
+    assert stats["total"] == pytest.approx(50.5)
+    assert stats["mean"] == pytest.approx(0.505)
+    assert stats["p50"] == pytest.approx(0.505)
+    assert stats["p90"] == pytest.approx(0.901)
+    assert stats["p99"] == pytest.approx(0.9901)
+    assert stats["max"] == pytest.approx(1.0)
+
+
+def test_get_stats_last_samples(enable_tracing):
+    """The percentiles are computed from the last `MAX_SAMPLES` durations only."""
+    for _ in range(tracing.MAX_SAMPLES):
+        tracing.record("span", 10.0)
+    for _ in range(tracing.MAX_SAMPLES):
+        tracing.record("span", 1.0)
+
+    stats = tracing.get_stats()["span"]
+    assert stats["count"] == 2 * tracing.MAX_SAMPLES
+    assert stats["mean"] == pytest.approx(5.5)
+    assert stats["p99"] == stats["max"] == 1.0
+
+
+def test_export_json(enable_tracing):
+    tracing.record("b", 2.0)
+    tracing.record("a", 1.0)
+
+    exported = json.loads(tracing.export_json())
+    assert exported["percentiles_of_last"] == tracing.MAX_SAMPLES
+    assert list(exported["spans"]) == ["a", "b"]
+    assert exported["spans"]["a"] == {
+        "count": 1,
+        "total": 1.0,
+        "mean": 1.0,
+        "p50": 1.0,
+        "p90": 1.0,
+        "p99": 1.0,
+        "max": 1.0,
+    }
@@ -0,0 +1,73 @@
+import sys
+import threading
+
+from empa_molecules import utils
+
+
+class FakeDisplayPublisher:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, data, metadata=None, **kwargs):
+        self.published.append(data)
+
+
+class FakeShell:
+    def __init__(self):
+        self.display_pub = FakeDisplayPublisher()
+
+
+def test_capture_thread_output(monkeypatch, capsys):
+    shell = FakeShell()
+    display_pub = shell.display_pub
+    monkeypatch.setattr(utils, "get_ipython", lambda: shell)
+    outputs = []
+    other_thread_done = threading.Event()
+
+    def other_thread():
+        print("other")
+        shell.display_pub.publish({"text/plain": "other"})
+        other_thread_done.set()
+
+    with utils.capture_thread_output(outputs):
+        print("first", end="")
+        print(" line")
+        shell.display_pub.publish({"text/plain": "image"}, metadata={"a": 1})
+        threading.Thread(target=other_thread).start()
+        other_thread_done.wait(5)
+        print("second")
+
+    assert outputs == [
+        {"output_type": "stream", "name": "stdout", "text": "first line\n"},
+        {
+            "output_type": "display_data",
+            "data": {"text/plain": "image"},
+            "metadata": {"a": 1},
+        },
+        {"output_type": "stream", "name": "stdout", "text": "second\n"},
+    ]
+    # The other threads print and display as usual.
+    assert capsys.readouterr().out == "other\n"
+    assert display_pub.published == [{"text/plain": "other"}]
+
+    # Everything is restored afterwards.
+    assert shell.display_pub is display_pub
+    print("after")
+    assert capsys.readouterr().out == "after\n"
+    assert outputs[-1]["text"] == "second\n"
+
+
+def test_capture_thread_output_without_shell(monkeypatch):
+    monkeypatch.setattr(utils, "get_ipython", lambda: None)
+    stdout = sys.stdout
+    outputs = []
+
+    try:
+        with utils.capture_thread_output(outputs):
+            print("text")
+            raise RuntimeError
+    except RuntimeError:
+        pass
+
+    assert outputs == [{"output_type": "stream", "name": "stdout", "text": "text\n"}]
+    assert sys.stdout is stdout
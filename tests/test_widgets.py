@@ -0,0 +1,69 @@
+import datetime
+
+import pytest
+
+from empa_molecules import search_index
+from empa_molecules.widgets import WorkChainSelectorWidget
+
+
+def get_conditions(text):
+    filters = WorkChainSelectorWidget.get_query_filters(text)
+    assert filters["attributes.process_label"] == "GaussianSpinWorkChain"
+    return filters.get("and")
+
+
+def test_get_query_filters():
+    assert get_conditions("") is None
+    assert get_conditions(" 42  Running failed C6H6 ") == [
+        {"id": 42},
+        {"attributes.process_state": "running"},
+        {"attributes.exit_status": {">": 0}},
+        {"extras.formula": {"like": "%C6H6%"}},
+    ]
+
+
+@pytest.mark.parametrize(
+    "word, start, end",
+    [
+        ("2026-02-28", (2026, 2, 28), (2026, 3, 1)),
+        ("2026-02", (2026, 2, 1), (2026, 3, 1)),
+        ("2026-12", (2026, 12, 1), (2027, 1, 1)),
+    ],
+)
+def test_get_query_filters_date(word, start, end):
+    assert get_conditions(word) == [
+        {
+            "ctime": {
+                "and": [
+                    {">=": datetime.datetime(*start)},
+                    {"<": datetime.datetime(*end)},
+                ]
+            }
+        }
+    ]
+
+
+@pytest.mark.parametrize("word", ["2026-13", "2026-02-30", "2026-1"])
+def test_get_query_filters_invalid_date(word):
+    """An invalid date is searched as text, instead of matching everything."""
+    assert get_conditions(word) == [{"extras.formula": {"like": f"%{word}%"}}]
+
+
+@pytest.mark.usefixtures("aiida_profile_clean")
+def test_find_work_chains_by_formula(generate_spin_work_chain):
+    finished = generate_spin_work_chain("H2O")
+    failed = generate_spin_work_chain("CH4", exit_status=300)
+    old = generate_spin_work_chain("C6H6", exit_status=300)
+    search_index.set_formula(finished)
+    search_index.set_formula(failed)
+
+    def find(text):
+        filters = WorkChainSelectorWidget.get_query_filters(text)
+        return [wc.pk for wc in WorkChainSelectorWidget.find_work_chains(filters)]
+
+    assert find("H2O") == [finished.pk]
+    assert find("CH4 failed") == [failed.pk]
+    assert find("C6H6") == []
+    assert search_index.index_formulas(batch_size=1) == 1
+    assert find("C6H6") == [old.pk]
+    assert find("H") == [old.pk, failed.pk, finished.pk]